@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Author: Vi
+# Description: 统一的命令行入口，python -m Scripts <tool> [参数...]
+
+'''
+各工具的模块只在对应子命令执行时才导入，--help 和轻量工具(pptx-notes、gif)不会加载torch、paddle、langchain等
+
+python -m Scripts --help
+python -m Scripts pptx-notes ppt目录 markdown目录
+python -m Scripts gif --help
+python -m Scripts --check-startup  # 检查启动耗时是否超出预算
+'''
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+
+# 子命令: (模块名, 说明)，每个模块都提供 main(argv) 入口
+TOOLS = {
+    'pptx-notes': ('ppt注释转为markdown', '批量提取ppt注释并转为markdown'),
+    'gif': ('多图转gif', '多张图片合成gif'),
+    'ocr': ('ocr提取雨课堂题目', '使用ocr提取雨课堂的题目，或离线识别图片目录'),
+    'demucs': ('demusc_demo', '使用demucs分离音频的人声和背景声'),
+    'rag': ('rag增强检索', 'RAG增强检索'),
+    'critical-path': ('criticalPath', '关键路径法：计算项目工期和赶工成本'),
+    'mooc': ('慕课刷视频', '自动播放雨课堂视频'),
+    'click': ('鼠标点击', '一个可移动的按钮，点击按钮可以点击其他位置'),
+}
+STARTUP_COMMANDS = [[], ['pptx-notes'], ['gif']]  # 启动耗时检查的命令，均加上--help执行
+STARTUP_BUDGET = 1.0  # 启动耗时预算(秒)
+
+
+def run_tool(name: str, argv: list[str]) -> int:
+    '''
+    导入工具模块并执行其main(argv)
+    '''
+    module_name, _ = TOOLS[name]
+    module = importlib.import_module(f'{__package__ or "Scripts"}.{module_name}')
+    sys.argv = [f'python -m Scripts {name}', *argv]  # 工具的usage中显示完整的命令
+    return module.main(argv) or 0
+
+
+def check_startup(budget: float = STARTUP_BUDGET) -> int:
+    '''
+    在新进程中执行STARTUP_COMMANDS，任一命令耗时超过budget秒时返回1
+    '''
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    failed = False
+    for command in STARTUP_COMMANDS:
+        args = [sys.executable, '-m', 'Scripts', *command, '--help']
+        start = time.perf_counter()
+        result = subprocess.run(args, cwd=root_dir, capture_output=True)
+        elapsed = time.perf_counter() - start
+        ok = result.returncode == 0 and elapsed <= budget
+        failed = failed or not ok
+        status = 'ok' if ok else ('超时' if result.returncode == 0 else f'失败({result.returncode})')
+        print(f"{' '.join(['python -m Scripts', *command, '--help']):<40} {elapsed:.3f}s  {status}")
+    return 1 if failed else 0
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m Scripts', description='python_save_the_world 工具集')
+    parser.add_argument('--check-startup', nargs='?', type=float, const=STARTUP_BUDGET, default=None,
+                        metavar='SECONDS', help=f'检查启动耗时，默认预算{STARTUP_BUDGET}秒')
+    commands = parser.add_subparsers(dest='tool', metavar='<tool>')
+    for name, (_, help) in TOOLS.items():
+        commands.add_parser(name, help=help, add_help=False)
+
+    # 工具名之后的参数原样交给工具自己的main解析，包括--help
+    argv = sys.argv[1:] if argv is None else list(argv)
+    index = next((i for i, arg in enumerate(argv) if arg in TOOLS), len(argv))
+    args = parser.parse_args(argv[:index])
+    if index < len(argv):
+        return run_tool(argv[index], argv[index + 1:])
+    if args.check_startup is not None:
+        return check_startup(args.check_startup)
+    parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
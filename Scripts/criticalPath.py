@@ -5,8 +5,10 @@
 '''
 import pandas as pd
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from decimal import Decimal
+from fractions import Fraction
+from collections import deque
 from typing import List
 from copy import deepcopy
 from itertools import combinations
@@ -19,6 +21,7 @@ class Task:
     cost: Decimal = None # 任务成本
     speed_up_duration: float = None # 加速工期
     speed_up_cost: Decimal = None # 加速成本
+    modes: list = None # 多档赶工报价[(工期, 成本), ...]，为空时由正常工期和加速工期组成
 
     ES: float = 0 # Early Start
     TF: float = 0 # Total Finish
@@ -30,6 +33,11 @@ class Task:
     is_critical: bool = False # 是否为关键路径节点
     is_speed_up: bool = False # 是否为加速节点
     index: int = -1 # 任务索引
+
+    def __post_init__(self):
+        # 只给了多档报价时，用工期最短的一档作为二选一赶工的加速工期
+        if self.modes and self.speed_up_duration is None:
+            self.speed_up_duration, self.speed_up_cost = min(self.modes, key=lambda mode: mode[0])
     
 class TaskTool:
     @staticmethod
@@ -239,6 +247,17 @@ class TaskPlan:
             
         return pd.DataFrame(all_plans)
     
+    def time_cost_curve(self)->pd.DataFrame:
+        '''
+        多档赶工的项目时间-成本曲线，见CrashOptimizer
+        '''
+        names = [f.name for f in fields(Task)]
+        tasks = [
+            Task(**{name: row[name] for name in names if name in row.index})
+            for _, row in self.tasks_df.iterrows()
+        ]
+        return CrashOptimizer(tasks).time_cost_curve()
+
     def get_min_cost_plan(self)->pd.DataFrame:
         '''
         获取最小成本的赶工计划
@@ -257,8 +276,382 @@ class TaskPlan:
             result.append(min_plans)
             
         return pd.concat(result)
-            
-if __name__ == '__main__':
+
+
+# region 多档赶工
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and pd.isna(value))
+
+
+def _to_number(value: Fraction):
+    '''
+    Fraction转为int或float，用于输出
+    '''
+    return int(value) if value.denominator == 1 else float(value)
+
+
+def task_modes(task: Task) -> list[tuple[Fraction, Fraction]]:
+    '''
+    任务的赶工方式[(工期, 成本), ...]，按工期从长到短排列，第一项为正常工期
+    没有modes时由(duration, cost)和(speed_up_duration, speed_up_cost)组成
+    '''
+    cost = Fraction(0) if _is_missing(task.cost) else Fraction(task.cost)
+    modes = {Fraction(task.duration): cost}
+    if task.modes:
+        raw_modes = task.modes
+    elif not _is_missing(task.speed_up_duration):
+        raw_modes = [(task.speed_up_duration, task.speed_up_cost)]
+    else:
+        raw_modes = []
+    for duration, mode_cost in raw_modes:
+        duration = Fraction(duration)
+        mode_cost = Fraction(0) if _is_missing(mode_cost) else Fraction(mode_cost)
+        if duration not in modes or mode_cost < modes[duration]:
+            modes[duration] = mode_cost
+    return sorted(modes.items(), reverse=True)
+
+
+def crash_segments(modes: list[tuple[Fraction, Fraction]]) -> list[tuple[Fraction, Fraction]]:
+    '''
+    报价的下凸包：相邻两点之间按天线性计价，每天的赶工成本(斜率)随工期缩短而不减
+    比正常工期更贵的更长工期、以及位于凸包上方的报价都不会被选中
+    :param modes: task_modes的结果
+    :return: 凸包上的点[(工期, 成本), ...]，工期从长到短
+    '''
+    hull = []
+    for duration, cost in modes:
+        while len(hull) >= 2:
+            (d1, c1), (d2, c2) = hull[-2], hull[-1]
+            # 新点与hull[-2]连线的斜率不大于hull[-1]所在线段的斜率时，hull[-1]在凸包上方
+            if (cost - c1) * (d1 - d2) <= (c2 - c1) * (d1 - duration):
+                hull.pop()
+            else:
+                break
+        hull.append((duration, cost))
+    return hull
+
+
+class CPMNetwork:
+    '''
+    关键路径的增量计算
+    head[i]: 最早开始时间(ES)；tail[i]: 从任务i开始到项目结束的最长路径长度
+    工期改变后只需重新计算拓扑序在改变任务之后的head和之前的tail
+    '''
+
+    def __init__(self, names: list[str], predecessors: list[list[str]]):
+        index = {name: i for i, name in enumerate(names)}
+        self.preds = []
+        for name, preds in zip(names, predecessors):
+            unknown = [p for p in preds if p not in index]
+            if unknown:
+                raise ValueError(f'任务{name}的前置任务不存在: {unknown}')
+            self.preds.append([index[p] for p in preds])
+        self.succs = [[] for _ in names]
+        for i, preds in enumerate(self.preds):
+            for p in preds:
+                self.succs[p].append(i)
+
+        in_degree = [len(preds) for preds in self.preds]
+        queue = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+        self.order = []
+        while queue:
+            i = queue.popleft()
+            self.order.append(i)
+            for j in self.succs[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    queue.append(j)
+        if len(self.order) != len(names):
+            raise ValueError('任务之间存在循环依赖')
+        self.position = [0] * len(names)
+        for pos, i in enumerate(self.order):
+            self.position[i] = pos
+        self.durations = None
+        self.head = [Fraction(0)] * len(names)
+        self.tail = [Fraction(0)] * len(names)
+
+    def compute(self, durations: list):
+        '''
+        完整计算一次
+        '''
+        self.durations = durations
+        self._forward(0)
+        self._backward(len(self.order) - 1)
+
+    def update(self, changed: list[int]):
+        '''
+        self.durations中changed这些任务的工期改变后，增量更新head和tail
+        '''
+        if not changed:
+            return
+        positions = [self.position[i] for i in changed]
+        self._forward(min(positions))
+        self._backward(max(positions))
+
+    def _forward(self, start: int):
+        for i in self.order[start:]:
+            self.head[i] = max((self.head[p] + self.durations[p] for p in self.preds[i]), default=Fraction(0))
+
+    def _backward(self, end: int):
+        for i in reversed(self.order[:end + 1]):
+            self.tail[i] = self.durations[i] + max((self.tail[s] for s in self.succs[i]), default=Fraction(0))
+
+    @property
+    def total_duration(self) -> Fraction:
+        return max(self.tail[i] for i in self.order if not self.preds[i])
+
+    def is_critical(self, i: int) -> bool:
+        return self.head[i] + self.tail[i] == self.total_duration
+
+    def longest_path(self, rates: list[int], delta: Fraction) -> tuple[Fraction, int]:
+        '''
+        各任务工期变为durations[i] - rates[i] * delta后的最长路径
+        :return: (最长路径长度, 该路径上rates之和)
+        '''
+        best = [None] * len(self.order)
+        for i in self.order:
+            start = max((best[p] for p in self.preds[i]), default=(Fraction(0), 0))
+            best[i] = (start[0] + self.durations[i] - rates[i] * delta, start[1] + rates[i])
+        return max(best[i] for i in self.order if not self.succs[i])
+
+
+def _max_flow(capacity: dict, source, sink) -> Fraction:
+    '''
+    Edmonds-Karp最大流，capacity为残量网络{u: {v: 残量}}，原地修改
+    '''
+    total = Fraction(0)
+    while True:
+        parent = {source: None}
+        queue = deque([source])
+        while queue and sink not in parent:
+            u = queue.popleft()
+            for v, cap in capacity[u].items():
+                if cap > 0 and v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if sink not in parent:
+            return total
+        path = []
+        v = sink
+        while parent[v] is not None:
+            path.append((parent[v], v))
+            v = parent[v]
+        flow = min(capacity[u][v] for u, v in path)
+        for u, v in path:
+            capacity[u][v] -= flow
+            capacity[v].setdefault(u, Fraction(0))
+            capacity[v][u] += flow
+        total += flow
+
+
+class CrashOptimizer:
+    '''
+    多档赶工的项目时间-成本曲线(Phillips-Dessouky割集法)
+
+    每个任务的报价按crash_segments取下凸包，两档之间按天线性计价。从全部正常工期开始迭代：
+    1. 在关键子网络上求最小割：割的正向任务缩短(每天成本为当前线段斜率)，
+       反向且已赶工的任务放慢(每天节省上一段的斜率)，整个项目缩短一天的成本最小
+    2. 步长取到某个任务到达报价档位，或者出现新的关键路径为止
+    3. 用CPMNetwork增量更新关键路径，直到不存在有限成本的割(关键路径上的任务都已赶到最短)
+    每一步的成本斜率不减，不需要枚举各任务档位的组合
+    '''
+
+    def __init__(self, tasks: List[Task]):
+        self.names = [task.name for task in tasks]
+        self.hulls = [crash_segments(task_modes(task)) for task in tasks]
+        self.network = CPMNetwork(self.names, [list(task.predecessors) for task in tasks])
+
+    # region 分段线性成本
+    def cost_at(self, i: int, duration: Fraction) -> Fraction:
+        hull = self.hulls[i]
+        for (d1, c1), (d2, c2) in zip(hull, hull[1:]):
+            if d2 <= duration <= d1:
+                return c1 + (c2 - c1) * (d1 - duration) / (d1 - d2)
+        return hull[0][1]
+
+    def shorten_segment(self, i: int, duration: Fraction):
+        '''
+        继续缩短时所在的线段: (每天成本, 可缩短的天数)，已经最短时返回None
+        '''
+        hull = self.hulls[i]
+        for (d1, c1), (d2, c2) in zip(hull, hull[1:]):
+            if d2 < duration <= d1:
+                return (c2 - c1) / (d1 - d2), duration - d2
+        return None
+
+    def lengthen_segment(self, i: int, duration: Fraction):
+        '''
+        放慢(撤销赶工)时所在的线段: (每天节省的成本, 可放慢的天数)，未赶工时返回None
+        '''
+        hull = self.hulls[i]
+        for (d1, c1), (d2, c2) in zip(hull, hull[1:]):
+            if d2 <= duration < d1:
+                return (c2 - c1) / (d1 - d2), d1 - duration
+        return None
+    # endregion
+
+    def _critical_edges(self, durations: list) -> list[tuple]:
+        '''
+        关键子网络的边 (u, v, 上界, 下界, 任务索引)
+        每个任务拆成('in', i)->('out', i)两个节点，前置关系和起点/终点的连接是工期为0的虚边
+        上界为缩短一天的成本，下界为放慢一天节省的成本，虚边和已最短的任务上界为None(无穷)
+        '''
+        network = self.network
+        total = network.total_duration
+        edges = []
+        for i in network.order:
+            if not network.is_critical(i):
+                continue
+            shorten = self.shorten_segment(i, durations[i])
+            lengthen = self.lengthen_segment(i, durations[i])
+            edges.append((('in', i), ('out', i), shorten[0] if shorten else None,
+                          lengthen[0] if lengthen else Fraction(0), i))
+            if network.head[i] == 0:
+                edges.append(('s', ('in', i), None, Fraction(0), None))
+            if network.head[i] + durations[i] == total:
+                edges.append((('out', i), 't', None, Fraction(0), None))
+            for p in network.preds[i]:
+                if network.is_critical(p) and network.head[p] + durations[p] == network.head[i]:
+                    edges.append((('out', p), ('in', i), None, Fraction(0), None))
+        return edges
+
+    def _min_cut(self, durations: list):
+        '''
+        带下界的最小割
+        :return: (缩短的任务, 放慢的任务, 项目每缩短一天的成本)，不存在有限成本的割时返回None
+        '''
+        edges = self._critical_edges(durations)
+        # 无穷大取为所有有限上界之和加1，割的容量不小于它就说明无法继续缩短
+        big = sum((upper for _, _, upper, _, _ in edges if upper is not None), Fraction(0)) + 1
+        capacity = {}
+        excess = {}
+        for u, v, upper, lower, _ in edges:
+            upper = big if upper is None else upper
+            capacity.setdefault(u, {})
+            capacity.setdefault(v, {})
+            capacity[u][v] = capacity[u].get(v, Fraction(0)) + upper - lower
+            capacity[v].setdefault(u, Fraction(0))
+            excess[v] = excess.get(v, Fraction(0)) + lower
+            excess[u] = excess.get(u, Fraction(0)) - lower
+
+        # 先求满足下界的可行流
+        capacity.setdefault('s', {})
+        capacity.setdefault('t', {})
+        capacity['t']['s'] = big * 2
+        capacity['s'].setdefault('t', Fraction(0))
+        capacity['S*'] = {}
+        capacity['T*'] = {}
+        for node, value in excess.items():
+            if value > 0:
+                capacity['S*'][node] = value
+                capacity[node].setdefault('S*', Fraction(0))
+            elif value < 0:
+                capacity[node]['T*'] = -value
+                capacity['T*'].setdefault(node, Fraction(0))
+        _max_flow(capacity, 'S*', 'T*')
+        for node in capacity:
+            capacity[node].pop('S*', None)
+            capacity[node].pop('T*', None)
+        del capacity['S*'], capacity['T*']
+        del capacity['t']['s'], capacity['s']['t']
+
+        # 再在残量网络上求s到t的最大流，s能到达的节点即为割的s侧
+        _max_flow(capacity, 's', 't')
+        reachable = {'s'}
+        queue = deque(['s'])
+        while queue:
+            u = queue.popleft()
+            for v, cap in capacity[u].items():
+                if cap > 0 and v not in reachable:
+                    reachable.add(v)
+                    queue.append(v)
+
+        forward, backward = [], []
+        rate = Fraction(0)
+        for u, v, upper, lower, i in edges:
+            if u in reachable and v not in reachable:
+                if upper is None:
+                    return None
+                rate += upper
+                if i is not None:
+                    forward.append(i)
+            elif v in reachable and u not in reachable:
+                rate -= lower
+                if i is not None and self.lengthen_segment(i, durations[i]) is not None:
+                    backward.append(i)
+        return forward, backward, rate
+
+    def _step(self, durations: list, forward: list[int], backward: list[int]) -> Fraction:
+        '''
+        步长：不超过各任务当前线段的剩余天数，也不能让非关键路径超过新的总工期
+        '''
+        delta = min(
+            [self.shorten_segment(i, durations[i])[1] for i in forward]
+            + [self.lengthen_segment(i, durations[i])[1] for i in backward]
+        )
+        rates = [0] * len(durations)
+        for i in forward:
+            rates[i] = 1
+        for i in backward:
+            rates[i] = -1
+        total = self.network.total_duration
+        while True:
+            length, rate = self.network.longest_path(rates, delta)
+            if length <= total - delta:
+                return delta
+            # 超出的路径长度为(length + rate * delta) - rate * delta，与total - delta的交点即为新的步长
+            delta = (total - (length + rate * delta)) / (1 - rate)
+
+    def _point(self, durations: list, slope=None, shortened=(), lengthened=()) -> dict:
+        network = self.network
+        return {
+            'total_duration': _to_number(network.total_duration),
+            'total_cost': _to_number(sum(self.cost_at(i, d) for i, d in enumerate(durations))),
+            'cost_slope': None if slope is None else _to_number(slope),
+            'shortened': [self.names[i] for i in shortened],
+            'lengthened': [self.names[i] for i in lengthened],
+            'durations': {name: _to_number(d) for name, d in zip(self.names, durations)},
+            'critical_path': [self.names[i] for i in network.order if network.is_critical(i)],
+        }
+
+    def time_cost_curve(self) -> pd.DataFrame:
+        '''
+        项目的时间-成本曲线，每行是曲线的一个拐点，相邻两行之间工期和成本线性变化
+        列: total_duration, total_cost, extra_cost(相对正常工期), cost_slope(上一段每缩短一天的成本),
+            shortened / lengthened(上一段缩短/放慢的任务), durations(各任务工期), critical_path
+        '''
+        durations = [hull[0][0] for hull in self.hulls]
+        self.network.compute(durations)
+        points = [self._point(durations)]
+        while True:
+            cut = self._min_cut(durations)
+            if cut is None:
+                break
+            forward, backward, rate = cut
+            delta = self._step(durations, forward, backward)
+            for i in forward:
+                durations[i] -= delta
+            for i in backward:
+                durations[i] += delta
+            self.network.update(forward + backward)
+            points.append(self._point(durations, rate, forward, backward))
+
+        curve = pd.DataFrame(points)
+        curve.insert(2, 'extra_cost', curve['total_cost'] - curve['total_cost'].iloc[0])
+        return curve
+# endregion
+
+
+def main(argv: list[str] = None):
+    '''
+    计算示例项目的关键路径和最小成本赶工计划
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='关键路径法：计算项目工期和赶工成本')
+    parser.add_argument('-o', '--output', default='test.csv', help='最小成本赶工计划的保存路径')
+    parser.add_argument('--curve', action='store_true', help='用割集法计算时间-成本曲线，代替枚举所有赶工组合')
+    args = parser.parse_args(argv)
+
     tasks = [
         Task(name="A", duration=4, cost=1500, speed_up_duration=3, speed_up_cost=1900, predecessors=[]),
         Task(name="B", duration=6, cost=1000, speed_up_duration=4, speed_up_cost=1300, predecessors=["A"]),
@@ -272,4 +665,14 @@ if __name__ == '__main__':
 
     plan = TaskPlan(tasks)
     plan.print_critical_path()
-    plan.get_min_cost_plan().to_csv("test.csv", index=False)
\ No newline at end of file
+    if args.curve:
+        curve = plan.time_cost_curve()
+        print(curve[['total_duration', 'total_cost', 'extra_cost', 'cost_slope', 'shortened', 'lengthened']])
+        curve.to_csv(args.output, index=False)
+    else:
+        plan.get_min_cost_plan().to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -13,6 +13,20 @@ pip install numpy==1.26.0
 import os
 import sys
 import gc
+import json
+import time
+import uuid
+import shutil
+import wave
+import hashlib
+import math
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import deque
+from itertools import islice, product
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import torch
 from rich.console import Console
@@ -21,7 +35,7 @@ import gradio as gr
 # Append parent paths so that demucs modules can be imported
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
 
-from demucs.audio import save_audio
+from demucs.audio import AudioFile, save_audio, i16_pcm, convert_audio_channels
 from torch.cuda import is_available as is_cuda_available
 from demucs.api import Separator
 from demucs.apply import BagOfModels
@@ -33,42 +47,274 @@ RAW_AUDIO_OUTPUT = os.path.join(AUDIO_DIR, "raw_{}.mp3")
 VOCAL_AUDIO_OUTPUT = os.path.join(AUDIO_DIR, "vocal_{}.mp3")
 BACKGROUND_AUDIO_OUTPUT = os.path.join(AUDIO_DIR, "background_{}.mp3")
 
+# Result cache: separated outputs keyed by audio content + model + parameters.
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "output/cache")
+CACHE_MAX_BYTES = int(os.getenv("DEMUCS_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# Outputs produced by default, their container format, and how they are encoded.
+DEFAULT_OUTPUTS = ("raw", "vocal", "background")
+DEFAULT_AUDIO_FORMAT = "mp3"  # "mp3" or "wav"
+ENCODE_EXECUTOR = os.getenv("DEMUCS_ENCODE_EXECUTOR", "thread")  # "thread" or "process"
+
+# Streaming separation: window length and crossfade between windows (seconds).
+STREAMING_WINDOW_SECONDS = 60
+STREAMING_OVERLAP_SECONDS = 1
+# In auto mode, tracks longer than this many windows are separated by streaming.
+STREAMING_MIN_WINDOWS = int(os.getenv("DEMUCS_STREAMING_MIN_WINDOWS", "3"))
+
+# Separation job queue: number of workers (one separator each) and max waiting jobs.
+SEPARATION_WORKERS = int(os.getenv("DEMUCS_WORKERS", "1"))
+MAX_QUEUE_SIZE = int(os.getenv("DEMUCS_MAX_QUEUE", "8"))
+
+# Batch separation: input files, resume manifest (under the output dir), decode-ahead depth.
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac")
+BATCH_MANIFEST_FILE = ".demucs_batch_manifest.json"
+BATCH_PREFETCH = 2
+
 
-# Preload the Demucs model globally to avoid reloading for each request.
 console = Console()
-console.print("🤖 Preloading <htdemucs> model...")
 
 # demucs 会把模型下载到缓存里
 # from demucs.pretrained import get_model
 # model = get_model("htdemucs") #
 
-# 直接下载到指定文件夹
+# 从本地文件夹加载，默认不联网；设置 DEMUCS_ALLOW_DOWNLOAD=1 时缺失的模型才会下载到该文件夹
 from demucs.states import load_model
 
 url = "https://dl.fbaipublicfiles.com/demucs/hybrid_transformer/955717e8-8726e21a.th"
-pkg = torch.hub.load_state_dict_from_url(
-    url, map_location="cpu", check_hash=True, model_dir=MODEL_DIR
-)  # type: ignore
-model = load_model(pkg)
+MODEL_CHECKPOINT = os.path.basename(url)
+MODEL_SIGNATURE = os.path.splitext(MODEL_CHECKPOINT)[0]
+MODEL_DIR = os.getenv("DEMUCS_MODEL_DIR", MODEL_DIR)
+ALLOW_DOWNLOAD = os.getenv("DEMUCS_ALLOW_DOWNLOAD", "0") == "1"
+# Keep a pickled copy of the built model next to the checkpoint for faster reloads.
+SAVE_SERIALIZED_MODEL = os.getenv("DEMUCS_SERIALIZED_MODEL", "1") == "1"
+# CPU tuning profile written by `demusc_demo.py benchmark --save-profile`.
+TUNING_PROFILE_PATH = os.getenv("DEMUCS_TUNING_PROFILE", os.path.join(MODEL_DIR, "tuning_profile.json"))
+
+
+class ModelManager:
+    """
+    Resolves the checkpoint from a local directory, verifies its hash once
+    (the result is recorded in a `.verified.json` sidecar), and loads the model lazily
+    on first use or in a background warm-up thread.
+    """
+
+    def __init__(
+        self,
+        model_dir: str = MODEL_DIR,
+        checkpoint: str = MODEL_CHECKPOINT,
+        allow_download: bool = ALLOW_DOWNLOAD,
+        save_serialized: bool = SAVE_SERIALIZED_MODEL,
+    ):
+        self.model_dir = model_dir
+        self.checkpoint = checkpoint
+        self.allow_download = allow_download
+        self.save_serialized = save_serialized
+        self.status = "not_loaded"  # not_loaded -> loading -> ready / failed
+        self.error = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.model_dir, self.checkpoint)
+
+    @property
+    def serialized_path(self) -> str:
+        return os.path.join(self.model_dir, f"{MODEL_SIGNATURE}.model.pt")
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def health(self) -> dict:
+        return {"model": MODEL_SIGNATURE, "status": self.status, "error": str(self.error or "") or None}
+
+    def resolve_checkpoint(self) -> str:
+        """
+        Local checkpoint path; downloads it only when allowed.
+        """
+        path = self.checkpoint_path
+        if os.path.exists(path):
+            return path
+        if not self.allow_download:
+            raise FileNotFoundError(
+                f"Model checkpoint not found: {path} (set DEMUCS_ALLOW_DOWNLOAD=1 to download)"
+            )
+        os.makedirs(self.model_dir, exist_ok=True)
+        console.print(f"⬇️ Downloading {url}...")
+        torch.hub.download_url_to_file(url, path, hash_prefix=self._expected_hash_prefix())
+        return path
+
+    def _expected_hash_prefix(self) -> str | None:
+        match = torch.hub.HASH_REGEX.search(self.checkpoint)
+        return match.group(1) if match else None
+
+    def verify(self, path: str):
+        """
+        Check the sha256 prefix encoded in the file name, at most once per file version.
+        """
+        sidecar = path + ".verified.json"
+        stat = os.stat(path)
+        fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+        if os.path.exists(sidecar):
+            with open(sidecar, "r", encoding="utf-8") as f:
+                if json.load(f) == fingerprint:
+                    return
+
+        expected = self._expected_hash_prefix()
+        if expected:
+            digest = file_sha256(path)
+            if not digest.startswith(expected):
+                raise RuntimeError(f"Hash mismatch for {path}: expected {expected}, got {digest[:len(expected)]}")
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump(fingerprint, f)
+
+    def _load(self):
+        path = self.resolve_checkpoint()
+        self.verify(path)
+        serialized = self.serialized_path
+        if os.path.exists(serialized) and os.path.getmtime(serialized) >= os.path.getmtime(path):
+            try:
+                return torch.load(serialized, map_location="cpu", weights_only=False, mmap=True)
+            except Exception as e:
+                console.print(f"[yellow]Ignoring serialized model {serialized}: {e}[/yellow]")
+
+        pkg = torch.load(path, map_location="cpu", weights_only=False)
+        loaded = load_model(pkg)
+        if self.save_serialized:
+            tmp_path = f"{serialized}.{uuid.uuid4().hex[:6]}.tmp"
+            torch.save(loaded, tmp_path)
+            os.replace(tmp_path, serialized)
+        return loaded
+
+    def get(self):
+        """
+        Return the model, loading it on first use.
+        """
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                console.print("🤖 Loading <htdemucs> model...")
+                self.status = "loading"
+                try:
+                    self._model = self._load()
+                except Exception as e:
+                    self.status = "failed"
+                    self.error = e
+                    raise
+                self._model.eval()
+                self.status = "ready"
+                self.error = None
+                console.print("[green]🤖 Model ready[/green]")
+        return self._model
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Load the model in a background thread.
+        """
+
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                console.print(f"[red]Model warm-up failed: {e}[/red]")
+
+        thread = threading.Thread(target=load, name="demucs-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def unload(self):
+        with self._lock:
+            self._model = None
+            self.status = "not_loaded"
+
+
+MODEL_MANAGER = ModelManager()
+
+
+# region Tuning profile
+# Separation parameters and their defaults when neither the caller nor the profile sets them.
+SEPARATION_DEFAULTS = {"shifts": 1, "overlap": 0.25, "segment": None, "jobs": 0}
+
+
+def load_tuning_profile(path: str = TUNING_PROFILE_PATH) -> dict:
+    """
+    Read a tuning profile; an unreadable or missing profile means "use the defaults".
+    A profile benchmarked on another model (e.g. the --tiny random model) is ignored too.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        console.print(f"[yellow]Ignoring tuning profile {path}: {e}[/yellow]")
+        return {}
+    model = profile.get("benchmark", {}).get("model", MODEL_SIGNATURE)
+    if model != MODEL_SIGNATURE:
+        console.print(f"[yellow]Ignoring tuning profile {path}: benchmarked on {model}, not {MODEL_SIGNATURE}[/yellow]")
+        return {}
+    return profile
+
+
+def save_tuning_profile(profile: dict, path: str = TUNING_PROFILE_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def apply_thread_settings(num_threads: int = None, num_interop_threads: int = None):
+    """
+    Configure torch intra-/inter-op threads. The inter-op pool can only be sized once,
+    before any parallel work, so a late call is ignored with a warning.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            console.print(f"[yellow]Cannot change inter-op threads: {e}[/yellow]")
+
+
+TUNING_PROFILE = load_tuning_profile()
+# endregion
 
 
 class PreloadedSeparator(Separator):
     """
-    Custom Separator class that preloads the Demucs model.
+    Custom Separator class that uses a preloaded Demucs model.
+    With model=None the model is taken from MODEL_MANAGER on first use.
+    shifts / overlap / segment / jobs left as None are taken from the tuning profile
+    (TUNING_PROFILE by default), then from SEPARATION_DEFAULTS.
+    `signature` identifies the model in result cache keys; by default it is MODEL_SIGNATURE
+    for the managed model and a hash of the weights for a caller-supplied model.
     """
 
     def __init__(
         self,
-        model: BagOfModels,
-        shifts: int = 1,
-        overlap: float = 0.25,
+        model: BagOfModels = None,
+        shifts: int = None,
+        overlap: float = None,
         split: bool = True,
-        segment: int = None,
-        jobs: int = 0,
+        segment: float = None,
+        jobs: int = None,
+        callback=None,
+        profile: dict = None,
+        signature: str = None,
     ):
-        self._model = model
-        self._audio_channels = model.audio_channels
-        self._samplerate = model.samplerate
+        self._preloaded_model = model
+        self._signature = signature
+        profile = TUNING_PROFILE if profile is None else profile
+        given = {"shifts": shifts, "overlap": overlap, "segment": segment, "jobs": jobs}
+        params = {
+            name: value if value is not None else profile.get(name, SEPARATION_DEFAULTS[name])
+            for name, value in given.items()
+        }
         device = (
             "cuda"
             if is_cuda_available()
@@ -76,35 +322,158 @@ class PreloadedSeparator(Separator):
         )
         self.update_parameter(
             device=device,
-            shifts=shifts,
-            overlap=overlap,
             split=split,
-            segment=segment,
-            jobs=jobs,
             progress=True,
-            callback=None,
+            callback=callback,
             callback_arg=None,
+            **params,
         )
 
+    @property
+    def _model(self):
+        if self._preloaded_model is None:
+            return MODEL_MANAGER.get()
+        return self._preloaded_model
+
+    @property
+    def model_signature(self) -> str:
+        if self._signature is None:
+            if self._preloaded_model is None:
+                self._signature = MODEL_SIGNATURE
+            else:
+                self._signature = model_weights_signature(self._preloaded_model)
+        return self._signature
 
-def demucs_separate(input_audio_path: str) -> dict:
+    @property
+    def _samplerate(self):
+        return self._model.samplerate
+
+    @property
+    def _audio_channels(self):
+        return self._model.audio_channels
+
+
+def model_weights_signature(model: torch.nn.Module) -> str:
     """
-    Main Demucs separation function without plotting functionality.
+    Hash of the model class and all of its weights.
+    """
+    h = hashlib.sha256(type(model).__name__.encode("utf-8"))
+    for name, tensor in model.state_dict().items():
+        h.update(name.encode("utf-8"))
+        h.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+# region Result cache
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
     """
-    # Generate a unique timestamp for output file names.
-    operation_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-    raw_audio_output = RAW_AUDIO_OUTPUT.format(operation_time)
-    vocal_audio_output = VOCAL_AUDIO_OUTPUT.format(operation_time)
-    background_audio_output = BACKGROUND_AUDIO_OUTPUT.format(operation_time)
+    Content-addressed cache of separation outputs on disk.
+
+    Each entry is a directory named by the cache key holding the output files.
+    The entry mtime is its last use; the least recently used entries are evicted
+    once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(input_audio_path: str, separator: "Separator", save_kwargs: dict) -> str:
+        """
+        Key = hash of audio content + model + separation parameters + encoding kwargs.
+        """
+        params = {
+            "audio": file_sha256(input_audio_path),
+            "model": getattr(separator, "model_signature", MODEL_SIGNATURE),
+            "shifts": separator._shifts,
+            "overlap": separator._overlap,
+            "split": separator._split,
+            "segment": separator._segment,
+            "save_kwargs": save_kwargs,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> dict | None:
+        """
+        Return {name: path} for a cached result, or None.
+        """
+        entry = self._entry(key)
+        with self._lock:
+            meta_path = os.path.join(entry, "meta.json")
+            if not os.path.exists(meta_path):
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                files = json.load(f)
+            paths = {name: os.path.join(entry, file) for name, file in files.items()}
+            if not all(os.path.exists(path) for path in paths.values()):
+                return None
+            os.utime(entry)  # mark as recently used
+        return paths
+
+    def put(self, key: str, files: dict) -> dict:
+        """
+        Move output files into the cache and return their new paths.
+        """
+        entry = self._entry(key)
+        tmp_entry = f"{entry}.{uuid.uuid4().hex[:6]}.tmp"
+        os.makedirs(tmp_entry)
+        names = {}
+        for name, path in files.items():
+            names[name] = f"{name}{os.path.splitext(path)[1]}"
+            shutil.move(path, os.path.join(tmp_entry, names[name]))
+        with open(os.path.join(tmp_entry, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(names, f)
+
+        with self._lock:
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.replace(tmp_entry, entry)
+            self._evict(keep=key)
+        return {name: os.path.join(entry, file) for name, file in names.items()}
+
+    def _evict(self, keep: str):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            entry = self._entry(name)
+            if name.endswith(".tmp") or not os.path.isdir(entry):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry)
+            )
+            entries.append((os.path.getmtime(entry), name, size))
+            total += size
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self._entry(name), ignore_errors=True)
+            total -= size
 
-    console.print("🎵 Separating audio...")
-    separator = PreloadedSeparator(model=model, shifts=1, overlap=0.25)
 
-    # Separate the input audio file.
-    raw_signal, outputs = separator.separate_audio_file(input_audio_path)
+RESULT_CACHE = ResultCache()
+# endregion
 
-    kwargs = {
-        "samplerate": model.samplerate,
+
+def get_save_kwargs() -> dict:
+    """
+    Encoding kwargs passed to save_audio (the samplerate is added from the model).
+    """
+    return {
         "bitrate": 64,
         "preset": 2,
         "clip": "rescale",
@@ -112,33 +481,866 @@ def demucs_separate(input_audio_path: str) -> dict:
         "bits_per_sample": 16,
     }
 
-    # Save original audio and separated tracks.
-    save_audio(raw_signal.cpu(), raw_audio_output, **kwargs)
-    console.print("🎤 Saving vocals track...")
-    save_audio(outputs["vocals"].cpu(), vocal_audio_output, **kwargs)
 
-    console.print("🎹 Saving background music...")
-    # Combine all sources except vocals to form background.
-    background = sum(audio for source, audio in outputs.items() if source != "vocals")
-    save_audio(background.cpu(), background_audio_output, **kwargs)
+# region Output stage
+def mix_background(stems: dict) -> torch.Tensor:
+    """
+    Sum all non-vocal stems in place into the first one (no intermediate tensors).
+    The stems dict must not be used afterwards.
+    """
+    background = None
+    for source, audio in stems.items():
+        if source == "vocals":
+            continue
+        if background is None:
+            background = audio
+        else:
+            background.add_(audio)
+    return background
+
+
+def _save_track(wav, path: str, kwargs: dict):
+    if not isinstance(wav, torch.Tensor):  # numpy array sent to a worker process
+        wav = torch.from_numpy(wav)
+    save_audio(wav, path, **kwargs)
+    return path
+
+
+def save_tracks(tracks: dict, paths: dict, kwargs: dict, executor: str = ENCODE_EXECUTOR):
+    """
+    Encode several tracks concurrently.
+    - param tracks: {name: tensor}
+    - param paths: {name: output path}, the suffix selects mp3 / wav; missing folders are created
+    - param executor: "thread" (tensors are shared) or "process" (tensors are copied to workers)
+    """
+    for path in paths.values():
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=len(paths))
+        tracks = {name: tracks[name].cpu().numpy() for name in paths}
+    else:
+        pool = ThreadPoolExecutor(max_workers=len(paths))
+        tracks = {name: tracks[name].cpu() for name in paths}
+    with pool:
+        futures = [pool.submit(_save_track, tracks[name], path, kwargs) for name, path in paths.items()]
+        for future in futures:
+            future.result()
+
+
+# endregion
+
+
+# region Streaming separation
+def iter_audio_chunks(path: str, samplerate: int, channels: int, chunk_frames: int):
+    """
+    Decode an audio file sequentially and yield float32 tensors of shape
+    (channels, <=chunk_frames) at the given sample rate.
+    Uses an ffmpeg pipe; without ffmpeg only PCM .wav files at `samplerate` are supported.
+    """
+    try:
+        process = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-i", path, "-f", "f32le",
+             "-ac", str(channels), "-ar", str(samplerate), "-"],
+            stdout=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        yield from _iter_wav_chunks(path, samplerate, channels, chunk_frames)
+        return
+
+    frame_bytes = 4 * channels
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(chunk_frames * frame_bytes)
+            if not data:
+                break
+            data = data[: len(data) - len(data) % frame_bytes]
+            chunk = torch.frombuffer(bytearray(data), dtype=torch.float32)
+            yield chunk.view(-1, channels).t()
+        finished = True
+    finally:
+        process.stdout.close()
+        if not finished:
+            # Closed early (cancelled job, error in the consumer): ffmpeg dies on SIGPIPE,
+            # its exit code means nothing and must not replace the original exception.
+            process.kill()
+            process.wait()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}")
+
+
+def _iter_wav_chunks(path: str, samplerate: int, channels: int, chunk_frames: int):
+    dtypes = {2: torch.int16, 4: torch.int32}
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != samplerate or f.getsampwidth() not in dtypes:
+            raise RuntimeError(
+                f"ffmpeg is required to stream {path} "
+                f"(only {samplerate} Hz 16/32-bit PCM wav can be read without it)"
+            )
+        width = f.getsampwidth()
+        scale = float(2 ** (8 * width - 1))
+        while True:
+            data = f.readframes(chunk_frames)
+            if not data:
+                break
+            chunk = torch.frombuffer(bytearray(data), dtype=dtypes[width]).float() / scale
+            chunk = chunk.view(-1, f.getnchannels()).t()
+            yield convert_audio_channels(chunk, channels)
+
+
+class StreamingAudioWriter:
+    """
+    Incremental mp3 (lameenc) or 16-bit wav writer.
+    Chunks are clamped to [-1, 1]; whole-track "rescale" clipping is not possible when streaming.
+    """
+
+    def __init__(self, path: str, samplerate: int, channels: int, bitrate: int = 64, preset: int = 2):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._mp3 = path.lower().endswith(".mp3")
+        if self._mp3:
+            import lameenc
+
+            self._encoder = lameenc.Encoder()
+            self._encoder.set_bit_rate(bitrate)
+            self._encoder.set_in_sample_rate(samplerate)
+            self._encoder.set_channels(channels)
+            self._encoder.set_quality(preset)
+            self._encoder.silence()
+            self._fp = open(path, "wb")
+        else:
+            self._fp = wave.open(path, "wb")
+            self._fp.setnchannels(channels)
+            self._fp.setsampwidth(2)
+            self._fp.setframerate(samplerate)
+
+    def write(self, wav: torch.Tensor):
+        pcm = i16_pcm(wav.detach().cpu().clone()).t().contiguous().numpy().tobytes()
+        if self._mp3:
+            self._fp.write(self._encoder.encode(pcm))
+        else:
+            self._fp.writeframes(pcm)
+
+    def close(self):
+        if self._mp3:
+            self._fp.write(self._encoder.flush())
+        self._fp.close()
+
+
+def audio_duration(path: str) -> float | None:
+    """
+    Track length in seconds from ffprobe (PCM .wav header without it), None if unknown.
+    """
+    try:
+        return AudioFile(path).duration
+    except (OSError, subprocess.CalledProcessError, KeyError, ValueError):
+        pass
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def use_streaming(path: str, streaming: bool | None = None) -> bool:
+    """
+    Resolve the streaming switch: True / False are kept, None (auto) streams tracks
+    longer than STREAMING_MIN_WINDOWS windows.
+    """
+    if streaming is not None:
+        return streaming
+    duration = audio_duration(path)
+    return duration is not None and duration > STREAMING_MIN_WINDOWS * STREAMING_WINDOW_SECONDS
+
+
+def separate_streaming(
+    input_audio_path: str,
+    separator: PreloadedSeparator,
+    outputs: dict,
+    window_seconds: float = STREAMING_WINDOW_SECONDS,
+    overlap_seconds: float = STREAMING_OVERLAP_SECONDS,
+    bitrate: int = 64,
+    preset: int = 2,
+):
+    """
+    Separate `input_audio_path` window by window and write the results incrementally.
+    Windows overlap by `overlap_seconds` and are joined with a linear crossfade, so peak
+    memory depends on the window length rather than on the track length.
+    - param outputs: {"raw": path, "vocal": path, "background": path}
+    """
+    samplerate = separator.samplerate
+    channels = separator.audio_channels
+    overlap = int(overlap_seconds * samplerate)
+    hop = int(window_seconds * samplerate) - overlap
+    if hop <= 0:
+        raise ValueError("window_seconds must be larger than overlap_seconds")
+
+    writers = {
+        name: StreamingAudioWriter(path, samplerate, channels, bitrate, preset)
+        for name, path in outputs.items()
+    }
+    buffer = torch.zeros(channels, 0)
+    tails = None  # last `overlap` frames of the previous window, not written yet
+    chunks = iter_audio_chunks(input_audio_path, samplerate, channels, hop)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and buffer.shape[1] < hop + overlap:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    buffer = torch.cat([buffer, chunk], dim=1)
+            if buffer.shape[1] == 0:
+                break
+
+            raw, stems = separator.separate_tensor(buffer)
+            vocals = stems["vocals"]
+            window = {"raw": raw, "vocal": vocals, "background": mix_background(stems)}
+            del stems
+
+            if tails is not None:
+                n = tails["raw"].shape[1]
+                fade = torch.linspace(0, 1, n)
+                for name in ("vocal", "background"):
+                    head = window[name][:, :n]
+                    head.mul_(fade).add_(tails[name] * (1 - fade))
+
+            last = exhausted and buffer.shape[1] <= hop + overlap
+            end = window["raw"].shape[1] if last else hop
+            for name, writer in writers.items():
+                writer.write(window[name][:, :end])
+            tails = None if last else {name: audio[:, hop:].clone() for name, audio in window.items()}
+            del window, raw, vocals
+            buffer = buffer[:, hop:]
+            if last:
+                break
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+# endregion
+
+
+def demucs_separate(
+    input_audio_path: str,
+    separator: PreloadedSeparator = None,
+    use_cache: bool = True,
+    streaming: bool | None = None,
+    outputs: tuple = DEFAULT_OUTPUTS,
+    audio_format: str = DEFAULT_AUDIO_FORMAT,
+) -> dict:
+    """
+    Main Demucs separation function without plotting functionality.
+    A new separator is created when `separator` is None.
+    With `use_cache`, repeated requests for the same audio and parameters are served
+    from RESULT_CACHE without running the model.
+    With `streaming`, long audio is separated window by window (see separate_streaming);
+    None (the default) streams tracks longer than STREAMING_MIN_WINDOWS windows.
+    `outputs` selects which of "raw", "vocal", "background" are written, as `audio_format`
+    ("mp3" or "wav"); the selected outputs are encoded concurrently.
+    """
+    if separator is None:
+        separator = PreloadedSeparator()
+    if audio_format not in ("mp3", "wav"):
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    unknown = set(outputs) - set(DEFAULT_OUTPUTS)
+    if unknown or not outputs:
+        raise ValueError(f"Unsupported outputs: {outputs}")
+    kwargs = get_save_kwargs()
+    streaming = use_streaming(input_audio_path, streaming)
+
+    cache_key = None
+    if use_cache:
+        start = time.perf_counter()
+        key_kwargs = dict(kwargs, outputs=sorted(outputs), audio_format=audio_format)
+        if streaming:
+            key_kwargs["streaming"] = [STREAMING_WINDOW_SECONDS, STREAMING_OVERLAP_SECONDS]
+        cache_key = ResultCache.make_key(input_audio_path, separator, key_kwargs)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            console.print(f"[green]⚡ Cache hit ({time.perf_counter() - start:.3f}s)[/green]")
+            return cached
+
+    # Generate a unique timestamp for output file names (with a random suffix,
+    # since several workers may finish within the same second).
+    operation_time = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    templates = {
+        "raw": RAW_AUDIO_OUTPUT,
+        "vocal": VOCAL_AUDIO_OUTPUT,
+        "background": BACKGROUND_AUDIO_OUTPUT,
+    }
+    files = {
+        name: f"{os.path.splitext(templates[name].format(operation_time))[0]}.{audio_format}"
+        for name in outputs
+    }
+
+    if streaming:
+        console.print("🎵 Separating audio (streaming)...")
+        separate_streaming(
+            input_audio_path, separator, files, bitrate=kwargs["bitrate"], preset=kwargs["preset"]
+        )
+    else:
+        console.print("🎵 Separating audio...")
+
+        # Separate the input audio file.
+        raw_signal, stems = separator.separate_audio_file(input_audio_path)
+        tracks = {"raw": raw_signal, "vocal": stems["vocals"]}
+        if "background" in files:
+            # Combine all sources except vocals to form background.
+            tracks["background"] = mix_background(stems)
+        del stems
+
+        console.print(f"💾 Saving {', '.join(files)}...")
+        save_tracks(tracks, files, dict(kwargs, samplerate=separator.samplerate))
 
-    # Free up memory.
-    del outputs, background, separator
-    gc.collect()
+        # Free up memory.
+        del tracks, raw_signal
+        gc.collect()
 
     console.print("[green]✨ Audio separation completed![/green]")
+    if cache_key is not None:
+        files = RESULT_CACHE.put(cache_key, files)
+    return files
+
+
+# region Job queue
+class QueueFullError(Exception):
+    """
+    Raised when the separation queue has no free slot.
+    """
+
+
+class SeparationJob:
+    """
+    A queued separation request.
+    status: queued -> running -> done / failed / cancelled
+    """
+
+    def __init__(self, input_audio_path: str):
+        self.id = uuid.uuid4().hex[:8]
+        self.input_audio_path = input_audio_path
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for the job to finish, return True if it finished.
+        """
+        return self._done.wait(timeout)
+
+    def finish(self, status: str, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class SeparationQueue:
+    """
+    Bounded FIFO of separation jobs processed by a fixed pool of worker threads.
+    Each worker owns one PreloadedSeparator that is reused for all of its jobs.
+    `streaming` is passed to demucs_separate (None: stream long tracks only).
+    """
+
+    def __init__(
+        self,
+        workers: int = SEPARATION_WORKERS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+        streaming: bool | None = None,
+    ):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.streaming = streaming
+        self._pending: deque[SeparationJob] = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        """
+        Start the worker threads (idempotent).
+        """
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"demucs-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, input_audio_path: str) -> SeparationJob:
+        """
+        Enqueue a job. Raises QueueFullError when the queue is full.
+        """
+        self.start()
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(f"队列已满（{self.max_queue_size}），请稍后再试")
+            job = SeparationJob(input_audio_path)
+            self._pending.append(job)
+            self._cond.notify()
+        return job
+
+    def position(self, job: SeparationJob) -> int:
+        """
+        1-based position of a waiting job, 0 if it is running or finished.
+        """
+        with self._cond:
+            try:
+                return self._pending.index(job) + 1
+            except ValueError:
+                return 0
+
+    def cancel(self, job: SeparationJob):
+        """
+        Cancel a job. Waiting jobs are removed; running jobs stop at the next chunk.
+        """
+        with self._cond:
+            job.cancel_requested = True
+            if job in self._pending:
+                self._pending.remove(job)
+                job.finish("cancelled")
+
+    def _worker(self):
+        current = {"job": None}
+
+        def check_cancel(_info: dict):
+            # Demucs aborts the separation when the callback raises KeyboardInterrupt.
+            if current["job"] is not None and current["job"].cancel_requested:
+                raise KeyboardInterrupt
+
+        # The model itself is loaded on the first job that misses the cache.
+        separator = PreloadedSeparator(callback=check_cancel)
+
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                job.status = "running"
+                current["job"] = job
+            try:
+                result = demucs_separate(job.input_audio_path, separator=separator, streaming=self.streaming)
+            except KeyboardInterrupt:
+                job.finish("cancelled")
+            except Exception as e:
+                console.print(f"[red]Job {job.id} failed: {e}[/red]")
+                job.finish("failed", error=e)
+            else:
+                job.finish("done", result=result)
+            finally:
+                current["job"] = None
+
+
+SEPARATION_QUEUE = SeparationQueue()
+# endregion
+
+
+# region Batch separation
+def find_audio_files(src_dir: str) -> list[str]:
+    """
+    Audio files under `src_dir` (relative paths, sorted for a stable processing order).
+    """
+    rel_paths = []
+    for root, _dirs, names in os.walk(src_dir):
+        for name in names:
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                rel_paths.append(os.path.relpath(os.path.join(root, name), src_dir))
+    return sorted(rel_paths)
+
+
+def file_fingerprint(path: str) -> dict:
+    """
+    Size and mtime; cheap enough for tens of thousands of tracks (no content hashing).
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def batch_output_paths(rel_path: str, save_dir: str, outputs: tuple, audio_format: str) -> dict:
+    """
+    Mirrored layout: <save_dir>/<relative path of the track>/<output>.<audio_format>
+    The track directory keeps the extension, so song.wav and song.mp3 do not collide.
+    """
+    track_dir = os.path.join(save_dir, rel_path)
+    return {name: os.path.join(track_dir, f"{name}.{audio_format}") for name in outputs}
+
+
+def save_batch_manifest(manifest: dict, manifest_path: str):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def prefetch_audio(paths: list[str], separator: PreloadedSeparator, depth: int = BATCH_PREFETCH):
+    """
+    Yield (path, wav or exception) in order while the next `depth` files are decoded
+    on background threads.
+    """
+
+    def decode(path):
+        try:
+            return separator._load_audio(path)
+        except Exception as e:
+            return e
+
+    depth = max(depth, 1)
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix="demucs-decode") as pool:
+        paths = iter(paths)
+        pending = deque((path, pool.submit(decode, path)) for path in islice(paths, depth))
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(decode, next_path)))
+            yield path, future.result()
+
+
+def batch_separate(
+    src_dir: str,
+    save_dir: str,
+    outputs: tuple = DEFAULT_OUTPUTS,
+    audio_format: str = DEFAULT_AUDIO_FORMAT,
+    separator: PreloadedSeparator = None,
+    prefetch: int = BATCH_PREFETCH,
+    force: bool = False,
+    streaming: bool | None = None,
+) -> dict:
+    """
+    Separate every audio file under `src_dir` into `save_dir` with one shared separator.
+    While a track is being separated, the next `prefetch` tracks are decoded on background
+    threads and the previous track is still being encoded, so the CPU does not idle between
+    tracks. Finished tracks are recorded in <save_dir>/.demucs_batch_manifest.json after each
+    track, so an interrupted run resumes where it stopped.
+    Tracks selected by `streaming` (see use_streaming) skip the decode-ahead and are
+    separated window by window after the others.
+    - param force: ignore the manifest and separate everything again
+    - return: summary {"total", "separated", "skipped", "failed", "errors"}
+    """
+    if audio_format not in ("mp3", "wav"):
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    unknown = set(outputs) - set(DEFAULT_OUTPUTS)
+    if unknown or not outputs:
+        raise ValueError(f"Unsupported outputs: {outputs}")
+    if separator is None:
+        separator = PreloadedSeparator()
+
+    os.makedirs(save_dir, exist_ok=True)
+    manifest_path = os.path.join(save_dir, BATCH_MANIFEST_FILE)
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    report = {"total": 0, "separated": 0, "skipped": 0, "failed": 0, "errors": {}}
+    todo = {}
+    for rel_path in find_audio_files(src_dir):
+        report["total"] += 1
+        src_path = os.path.join(src_dir, rel_path)
+        fingerprint = file_fingerprint(src_path)
+        files = batch_output_paths(rel_path, save_dir, outputs, audio_format)
+        record = manifest.get(rel_path)
+        if (
+            record is not None
+            and record["fingerprint"] == fingerprint
+            and set(outputs) <= set(record["outputs"])
+            and all(os.path.exists(path) for path in files.values())
+        ):
+            report["skipped"] += 1
+            continue
+        todo[src_path] = (rel_path, fingerprint, files)
+
+    if not todo:
+        return report
+    streamed = [src_path for src_path in todo if use_streaming(src_path, streaming)]
+
+    kwargs = dict(get_save_kwargs(), samplerate=separator.samplerate)
+    lock = threading.Lock()  # finish() runs on both the main and the encoder thread
+    done = 0
+
+    def finish(rel_path, fingerprint, files, error=None):
+        with lock:
+            _finish(rel_path, fingerprint, files, error)
+
+    def _finish(rel_path, fingerprint, files, error):
+        nonlocal done
+        done += 1
+        if error is None:
+            report["separated"] += 1
+            manifest[rel_path] = {
+                "fingerprint": fingerprint,
+                "outputs": sorted(files),
+                "format": audio_format,
+            }
+            console.print(f"[green]✨ [{done}/{len(todo)}] {rel_path}[/green]")
+        else:
+            report["failed"] += 1
+            report["errors"][rel_path] = str(error)
+            manifest.pop(rel_path, None)
+            console.print(f"[red]❌ [{done}/{len(todo)}] {rel_path}: {error}[/red]")
+        save_batch_manifest(manifest, manifest_path)
+
+    # One encoder thread: the previous track is encoded while the next one is separated.
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="demucs-encode")
+    pending_write = None
+    try:
+        whole = [src_path for src_path in todo if src_path not in streamed]
+        for src_path, wav in prefetch_audio(whole, separator, prefetch):
+            rel_path, fingerprint, files = todo[src_path]
+            if isinstance(wav, Exception):
+                finish(rel_path, fingerprint, files, wav)
+                continue
+            try:
+                raw_signal, stems = separator.separate_tensor(wav)
+            except Exception as e:
+                finish(rel_path, fingerprint, files, e)
+                continue
+            del wav
+            tracks = {"raw": raw_signal, "vocal": stems["vocals"]}
+            if "background" in files:
+                tracks["background"] = mix_background(stems)
+            del stems, raw_signal
+
+            if pending_write is not None:
+                pending_write.result()
+
+            def write(tracks=tracks, files=files, rel_path=rel_path, fingerprint=fingerprint):
+                try:
+                    save_tracks(tracks, files, kwargs)
+                except Exception as e:
+                    finish(rel_path, fingerprint, files, e)
+                else:
+                    finish(rel_path, fingerprint, files)
+
+            pending_write = writer.submit(write)
+            del tracks
+        if pending_write is not None:
+            pending_write.result()
+
+        for src_path in streamed:
+            rel_path, fingerprint, files = todo[src_path]
+            try:
+                separate_streaming(src_path, separator, files, bitrate=kwargs["bitrate"], preset=kwargs["preset"])
+            except Exception as e:
+                finish(rel_path, fingerprint, files, e)
+            else:
+                finish(rel_path, fingerprint, files)
+    finally:
+        writer.shutdown(wait=True)
+        with lock:
+            save_batch_manifest(manifest, manifest_path)
+    return report
+
+
+def print_batch_report(report: dict):
+    console.print(
+        f"{report['total']} tracks: {report['separated']} separated, "
+        f"{report['skipped']} skipped, {report['failed']} failed"
+    )
+    for rel_path, error in report["errors"].items():
+        console.print(f"[red]  failed: {rel_path}: {error}[/red]")
+
+
+# endregion
+
+
+# region Benchmark
+def synthetic_audio(seconds: float, samplerate: int = 44100, channels: int = 2, seed: int = 0) -> torch.Tensor:
+    """
+    Deterministic test signal (a few harmonics plus noise); the content does not affect speed.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    t = torch.arange(int(seconds * samplerate)) / samplerate
+    tone = sum(torch.sin(2 * math.pi * freq * t) for freq in (110, 220, 440, 880)) * 0.1
+    return (tone + 0.05 * torch.randn(channels, t.shape[0], generator=generator)).float()
+
+
+def tiny_random_model():
+    """
+    Small randomly initialised HTDemucs with the htdemucs sources, so the benchmark runs
+    offline. Its timings are only meaningful relative to each other.
+    """
+    from demucs.htdemucs import HTDemucs
+
+    torch.manual_seed(0)
+    model = HTDemucs(
+        sources=["drums", "bass", "other", "vocals"],
+        channels=8,
+        depth=2,
+        t_layers=1,
+        t_heads=2,
+        bottom_channels=0,
+        segment=4,
+        nfft=512,
+    )
+    return model.eval()
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Peak resident memory of this process (None where the resource module is unavailable).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_benchmark(config: dict, audio_path: str, seconds: float, tiny: bool = False,
+                  audio_format: str = "wav", repeat: int = 1) -> dict:
+    """
+    Time one configuration: load, decode, separate, mix and encode `audio_path`.
+    Meant to run in a fresh process so that thread settings and peak RSS are not shared.
+    The fastest of `repeat` runs is reported, after one short untimed warm-up.
+    """
+    apply_thread_settings(config.get("num_threads"), config.get("num_interop_threads"))
+    start = time.perf_counter()
+    model = tiny_random_model() if tiny else MODEL_MANAGER.get()
+    load_time = time.perf_counter() - start
+
+    separator = PreloadedSeparator(
+        model=model,
+        shifts=config.get("shifts", SEPARATION_DEFAULTS["shifts"]),
+        overlap=config.get("overlap", SEPARATION_DEFAULTS["overlap"]),
+        segment=config.get("segment"),
+        jobs=config.get("jobs", SEPARATION_DEFAULTS["jobs"]),
+        profile={},
+        signature="tiny-random" if tiny else MODEL_SIGNATURE,
+    )
+    separator.update_parameter(progress=False)
+    separator.separate_tensor(synthetic_audio(1, separator.samplerate, separator.audio_channels))
+
+    kwargs = dict(get_save_kwargs(), samplerate=separator.samplerate)
+    best = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = {name: os.path.join(tmp_dir, f"{name}.{audio_format}") for name in DEFAULT_OUTPUTS}
+        for _ in range(max(repeat, 1)):
+            stages = {}
+            start = time.perf_counter()
+            wav = separator._load_audio(audio_path)
+            stages["decode"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            raw_signal, stems = separator.separate_tensor(wav)
+            stages["separate"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tracks = {"raw": raw_signal, "vocal": stems["vocals"], "background": mix_background(stems)}
+            stages["mix"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            save_tracks(tracks, files, kwargs)
+            stages["encode"] = time.perf_counter() - start
+            del wav, raw_signal, stems, tracks
+
+            if best is None or sum(stages.values()) < sum(best.values()):
+                best = stages
+
+    total = sum(best.values())
     return {
-        "raw": raw_audio_output,
-        "vocal": vocal_audio_output,
-        "background": background_audio_output,
+        **config,
+        "rtf": total / seconds,
+        "separate_rtf": best["separate"] / seconds,
+        "stages": dict(best, load=load_time),
+        "peak_rss_mb": peak_rss_mb(),
+        "num_threads": config.get("num_threads") or torch.get_num_threads(),
     }
 
 
-def process_audio(uploaded_audio):
+def sweep_configs(segments: list, overlaps: list, jobs: list, threads: list, interop_threads: list) -> list[dict]:
+    return [
+        {"segment": segment, "overlap": overlap, "jobs": job, "num_threads": thread, "num_interop_threads": interop}
+        for segment, overlap, job, thread, interop in product(segments, overlaps, jobs, threads, interop_threads)
+    ]
+
+
+def benchmark(configs: list[dict], seconds: float = 30, tiny: bool = False,
+              audio_format: str = "wav", repeat: int = 1) -> list[dict]:
+    """
+    Run every configuration on `seconds` of synthetic audio, each in its own process.
+    Failed configurations (e.g. a segment longer than the model supports) keep an "error" key.
+    Returns the results sorted by real-time factor (processing time / audio duration).
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_path = os.path.join(tmp_dir, "synthetic.wav")
+        save_audio(synthetic_audio(seconds), audio_path, samplerate=44100)
+        for i, config in enumerate(configs, 1):
+            console.print(f"⏱️ [{i}/{len(configs)}] {config}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                future = pool.submit(run_benchmark, config, audio_path, seconds, tiny, audio_format, repeat)
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({**config, "error": str(e)})
+    return sorted(results, key=lambda result: result.get("rtf", float("inf")))
+
+
+def print_benchmark(results: list[dict]):
+    from rich.table import Table
+
+    table = Table(title="Demucs CPU benchmark (sorted by real-time factor)")
+    for column in ("segment", "overlap", "jobs", "threads", "interop", "RTF", "separate RTF",
+                   "decode s", "separate s", "mix s", "encode s", "load s", "peak RSS MB"):
+        table.add_column(column, justify="right")
+    for result in results:
+        head = [str(result.get(key)) for key in ("segment", "overlap", "jobs", "num_threads", "num_interop_threads")]
+        if "error" in result:
+            table.add_row(*head, f"[red]{result['error'].splitlines()[0][:60]}[/red]", *[""] * 7)
+            continue
+        stages = result["stages"]
+        table.add_row(
+            *head,
+            f"{result['rtf']:.3f}",
+            f"{result['separate_rtf']:.3f}",
+            *[f"{stages[name]:.2f}" for name in ("decode", "separate", "mix", "encode", "load")],
+            f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-",
+        )
+    console.print(table)
+
+
+def profile_from_result(result: dict, seconds: float, tiny: bool) -> dict:
+    """
+    Tuning profile loaded by PreloadedSeparator / apply_thread_settings at startup.
+    """
+    profile = {name: result.get(name, default) for name, default in SEPARATION_DEFAULTS.items()}
+    profile["num_threads"] = result["num_threads"]
+    profile["num_interop_threads"] = result.get("num_interop_threads")
+    profile["benchmark"] = {
+        "rtf": result["rtf"],
+        "audio_seconds": seconds,
+        "model": "tiny-random" if tiny else MODEL_SIGNATURE,
+        "cpu_count": os.cpu_count(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    return profile
+
+
+# endregion
+
+
+def process_audio(uploaded_audio, progress=gr.Progress()):
     """
     Gradio interface function. It accepts an uploaded audio file and returns three audio outputs.
     uploaded_audio may be a dict with a key "name" (indicating file path)
     or a file path string.
+    The request goes through SEPARATION_QUEUE; this is a generator so that cancelling
+    the Gradio event closes it and cancels the queued job.
     """
     if isinstance(uploaded_audio, dict) and "name" in uploaded_audio:
         input_audio_path = uploaded_audio["name"]
@@ -147,42 +1349,181 @@ def process_audio(uploaded_audio):
     else:
         raise ValueError("Unsupported audio input format")
 
-    files = demucs_separate(input_audio_path)
-    return files["raw"], files["vocal"], files["background"]
+    try:
+        job = SEPARATION_QUEUE.submit(input_audio_path)
+    except QueueFullError as e:
+        raise gr.Error(str(e))
 
+    try:
+        while not job.wait(timeout=1):
+            position = SEPARATION_QUEUE.position(job)
+            if position > 0:
+                progress(0, desc=f"排队中，前面还有 {position - 1} 个任务")
+            else:
+                progress(0.5, desc="分离中...")
+            yield gr.update(), gr.update(), gr.update()
+    finally:
+        if not job.done:
+            SEPARATION_QUEUE.cancel(job)
 
-# Define Gradio Interface with three audio components:
-# - Input audio box for uploading the audio.
-# - Three output audio boxes for raw, vocal, and background tracks.
-with gr.Blocks(title="Audio Separation with Demucs") as demo:
-    gr.Markdown(
-        "## Audio Separation with Demucs\n上传音频后，将会返回分离后的原始音频、vocal 音频和 background 音频。"
-    )
+    if job.status != "done":
+        raise gr.Error(f"音频分离失败: {job.error or job.status}")
+    files = job.result
+    yield files.get("raw"), files.get("vocal"), files.get("background")
 
-    # with gr.Row():
-    with gr.Column():
-        input_audio = gr.Audio(sources=["upload"], type="filepath", label="上传音频")
-        submit_btn = gr.Button("分离音频")
-    with gr.Column():
-        raw_audio_output = gr.Audio(label="原始音频")
-        vocal_audio_output = gr.Audio(label="Vocal 音频")
-        background_audio_output = gr.Audio(label="Background 音频")
-
-    submit_btn.click(
-        fn=process_audio,
-        inputs=input_audio,
-        outputs=[raw_audio_output, vocal_audio_output, background_audio_output],
-    )
 
-if __name__ == "__main__":
+def build_demo() -> gr.Blocks:
+    """
+    Build the Gradio UI. Called when the server starts, not at import time,
+    so the batch / benchmark commands (and benchmark worker processes) skip it.
+    """
+    # Define Gradio Interface with three audio components:
+    # - Input audio box for uploading the audio.
+    # - Three output audio boxes for raw, vocal, and background tracks.
+    with gr.Blocks(title="Audio Separation with Demucs") as demo:
+        gr.Markdown(
+            "## Audio Separation with Demucs\n上传音频后，将会返回分离后的原始音频、vocal 音频和 background 音频。"
+        )
+
+        # with gr.Row():
+        with gr.Column():
+            input_audio = gr.Audio(sources=["upload"], type="filepath", label="上传音频")
+            submit_btn = gr.Button("分离音频")
+            cancel_btn = gr.Button("取消")
+        with gr.Column():
+            raw_audio_output = gr.Audio(label="原始音频")
+            vocal_audio_output = gr.Audio(label="Vocal 音频")
+            background_audio_output = gr.Audio(label="Background 音频")
+
+        # Admission control is done by SEPARATION_QUEUE, so Gradio itself does not limit concurrency.
+        submit_event = submit_btn.click(
+            fn=process_audio,
+            inputs=input_audio,
+            outputs=[raw_audio_output, vocal_audio_output, background_audio_output],
+            concurrency_limit=None,
+        )
+        cancel_btn.click(fn=None, cancels=[submit_event])
+    return demo
+
+
+def create_app():
+    """
+    FastAPI app serving the Gradio UI and a /health endpoint that answers
+    immediately, while the model is still loading.
+    """
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        return MODEL_MANAGER.health()
+
+    return gr.mount_gradio_app(app, build_demo(), path="/")
+
+
+def serve():
+    import uvicorn
+
     os.makedirs(MODEL_DIR, exist_ok=True)
-    os.makedirs(AUDIO_DIR, exist_ok=True)
     try:
-        demo.launch(server_name="0.0.0.0", server_port=7860)
+        MODEL_MANAGER.warm_up()
+        uvicorn.run(create_app(), host="0.0.0.0", port=7860)
     finally:
         console.print("🧹 Cleaning up...")
-        del model
-        import shutil
+        MODEL_MANAGER.unload()
         # 删除Audio目录
-        shutil.rmtree(AUDIO_DIR)
+        shutil.rmtree(AUDIO_DIR, ignore_errors=True)
         gc.collect()
+
+
+def _parse_list(text: str, cast) -> list:
+    """
+    "4,7.8,none" -> [4.0, 7.8, None]
+    """
+    return [None if item.strip().lower() in ("", "none") else cast(item) for item in text.split(",")]
+
+
+def main(argv: list[str] = None):
+    """
+    Without arguments the Gradio server is started; `batch` separates whole folders headlessly,
+    `benchmark` measures separation settings and can save the fastest as the tuning profile.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Audio separation with Demucs")
+    commands = parser.add_subparsers(dest="command")
+    streaming = argparse.ArgumentParser(add_help=False)
+    streaming.add_argument(
+        "--streaming", choices=("auto", "on", "off"), default="auto",
+        help=f"separate window by window; auto: tracks longer than "
+             f"{STREAMING_MIN_WINDOWS}x{STREAMING_WINDOW_SECONDS}s",
+    )
+    commands.add_parser("serve", parents=[streaming], help="start the Gradio server (default)")
+    batch = commands.add_parser("batch", parents=[streaming], help="separate every audio file under a folder")
+    batch.add_argument("src_dir", help="folder with audio files (searched recursively)")
+    batch.add_argument("save_dir", help="output folder, mirrors the layout of src_dir")
+    batch.add_argument("--outputs", default=",".join(DEFAULT_OUTPUTS), help="comma separated: raw,vocal,background")
+    batch.add_argument("--format", default=DEFAULT_AUDIO_FORMAT, choices=("mp3", "wav"))
+    batch.add_argument("--prefetch", type=int, default=BATCH_PREFETCH, help="tracks decoded ahead")
+    batch.add_argument("--threads", type=int, default=None, help="torch intra-op threads, default: from the tuning profile")
+    batch.add_argument("--jobs", type=int, default=None, help="demucs parallel jobs per track, default: from the tuning profile")
+    batch.add_argument("--force", action="store_true", help="ignore the manifest and separate everything again")
+    bench = commands.add_parser("benchmark", help="sweep CPU settings on synthetic audio")
+    bench.add_argument("--seconds", type=float, default=30, help="length of the synthetic audio")
+    bench.add_argument("--segment", default="none", help="comma separated segment lengths (s), none = model default")
+    bench.add_argument("--overlap", default=str(SEPARATION_DEFAULTS["overlap"]), help="comma separated overlaps")
+    bench.add_argument("--jobs", default="0", help="comma separated demucs job counts")
+    bench.add_argument("--threads", default=str(os.cpu_count()), help="comma separated torch intra-op thread counts")
+    bench.add_argument("--interop-threads", default="none", help="comma separated torch inter-op thread counts")
+    bench.add_argument("--repeat", type=int, default=1, help="timed runs per setting, the fastest is kept")
+    bench.add_argument("--format", default="wav", choices=("mp3", "wav"), help="format for the encode stage")
+    bench.add_argument("--tiny", action="store_true", help="use a tiny random model (offline, relative timings only)")
+    bench.add_argument("--save-profile", nargs="?", const=TUNING_PROFILE_PATH, default=None,
+                       help=f"save the fastest setting as tuning profile (default path: {TUNING_PROFILE_PATH})")
+    args = parser.parse_args(argv)
+
+    if args.command == "benchmark":
+        configs = sweep_configs(
+            _parse_list(args.segment, float),
+            _parse_list(args.overlap, float),
+            _parse_list(args.jobs, int),
+            _parse_list(args.threads, int),
+            _parse_list(args.interop_threads, int),
+        )
+        results = benchmark(configs, args.seconds, tiny=args.tiny, audio_format=args.format, repeat=args.repeat)
+        print_benchmark(results)
+        if args.save_profile:
+            if "error" in results[0]:
+                console.print("[red]No successful run, profile not saved[/red]")
+                return 1
+            save_tuning_profile(profile_from_result(results[0], args.seconds, args.tiny), args.save_profile)
+            console.print(f"[green]💾 Tuning profile saved to {args.save_profile}[/green]")
+        return 0
+
+    apply_thread_settings(TUNING_PROFILE.get("num_threads"), TUNING_PROFILE.get("num_interop_threads"))
+    streaming = {"auto": None, "on": True, "off": False}[getattr(args, "streaming", "auto")]
+    if args.command != "batch":
+        SEPARATION_QUEUE.streaming = streaming
+        serve()
+        return 0
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    separator = PreloadedSeparator(jobs=args.jobs)
+    report = batch_separate(
+        args.src_dir,
+        args.save_dir,
+        outputs=tuple(name.strip() for name in args.outputs.split(",") if name.strip()),
+        audio_format=args.format,
+        separator=separator,
+        prefetch=args.prefetch,
+        force=args.force,
+        streaming=streaming,
+    )
+    print_batch_report(report)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
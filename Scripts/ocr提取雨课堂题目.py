@@ -15,18 +15,50 @@
 """
 
 import os
+import re
+import copy
+import json
+import time
+import asyncio
+import hashlib
 import datetime
-import tempfile
+import threading
+from types import SimpleNamespace
 from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
 
-from clipboard import copy
+import importlib
+
+import numpy as np
 from PIL import Image
-import pyautogui as pg
-from paddleocr import PaddleOCR
 
-OCR = PaddleOCR(use_angle_cls=True, lang="ch", use_gpu=False, show_log=False)
+
+class LazyModule:
+    """
+    第一次访问属性时才导入模块，如pyautogui在没有图形界面的环境中导入就会报错，离线识别用不到它
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pg = LazyModule('pyautogui')
+
+OCR_KWARGS = dict(use_angle_cls=True, lang="ch", use_gpu=False, show_log=False)
+OCR = None  # PaddleOCR实例，第一次识别时创建，每个进程一个
 
 USE_AI = True  # 是否使用AI自动补充题目选项
+AI_STUB = os.getenv('AI_STUB') == '1'  # 使用本地假模型测试流水线，不调用接口
+AI_CONCURRENCY = 4  # 同时请求AI的题目数
+AI_RETRIES = 3  # 请求失败后的重试次数
+AI_RETRY_DELAY = 1.0  # 第一次重试前等待的秒数，之后每次翻倍
 PG_SLEEP_TIME = 0.5  # pyautogui的睡眠时间
 START_INDEX = 27643621  # 开始的作业序号
 START_INDEX = 27643660  # 开始的作业序号
@@ -34,6 +66,13 @@ END_INDEX = 27643801  # 结束的作业序号
 
 URL_TEMP = "https://changjiang.yuketang.cn/v2/web/cloud/student/exercise/18949303/{start}/9158353?hide_return=1"
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')  # 离线批量识别的图片格式
+OCR_CHUNK_SIZE = 8  # 批量识别时每次交给工作进程的图片数
+OCR_REC_BATCH_NUM = 16  # 每次送入方向分类和识别模型的文本行数，一组图片的文本行合并后再分批
+
+DHASH_SIZE = 16  # 感知哈希的边长，16x16=256位，足以区分版式相近的题目
+OCR_CACHE_SIZE = 256  # OCR结果缓存的条数
+
 # region 全局变量: 坐标位置
 HOMEWORK_REGION = (150, 120, 700 - 150, 150 - 120)  # 作业名字截图区域
 QUESTION_TYPE_REGION = (440, 215, 590 - 440, 260 - 215)  # 题目类型截图区域
@@ -44,73 +83,180 @@ URL_POS = (240, 60)  # 题目链接位置
 # endregion
 
 # region AI
-from dotenv import load_dotenv
+# system是机器人，human是人类用户
+PROMPT_MESSAGES = [
+    ('system', '现在你是一个项目管理概论老师的助理，你需要帮我整理考试的题目。对于单选题或多选题，你需要补充选项编号（如A、B、C、D），并去掉多余的换行符或多余符号。对于判断题，同样需要去掉多余的换行符。如果是包含一些缩写，在后面添加上注释。以下是一些例子：'
+        '\n\n## 1.单选题\n'
+        '从人类社会整体上来看，下列关于项目与日常运营关系的描述错误的是\n'
+        '项目往往是先于日常运营存在的\n'
+        '日常运营不是以项目为基础的\n'
+        '项目投入需要通过日常运营来回收\n'
+        '广义的项目包含了狭义的项目和日常运营\n'
+        '正确答案：B\n'
+        '修改为：\n'
+        '## 1.单选题\n'
+        '从人类社会整体上来看，下列关于项目与日常运营关系的描述错误的是\n'
+        'A. 项目往往是先于日常运营存在的\n'
+        'B. 日常运营不是以项目为基础的\n'
+        'C. 项目投入需要通过日常运营来回收\n'
+        'D. 广义的项目包含了狭义的项目和日常运营\n'
+        '正确答案：B\n\n'
+        '*********************************\n\n'
+        '## 10.判断题\n'
+        '项目管理的重要工作是从两个方面管理和约束各项目相关利益主体的需求和期望，其一是不要使人们的要求与期望过高而不切实际，其二是努力满足和超越人们的要求与期望。\n'
+        'X\n'
+        '正确答案：正确\n'
+        '修改为：\n'
+        '## 10.判断题\n'
+        '项目管理的重要工作是从两个方面管理和约束各项目相关利益主体的需求和期望，其一是不要使人们的要求与期望过高而不切实际，其二是努力满足和超越人们的要求与期望。\n'
+        '正确答案：正确'
+        '*********************************\n\n'
+        '## 5.单选题\n'
+        ' （）是用于给出项目工作范围的图形文件，包括项目工作包、项目工作包之间的关系以及项目工作包与项目产出物或项目交付物之间的关系。\n'
+        'A. OBS\n'
+        'B. WBS\n'
+        'C. RBS\n'
+        'D. BOM\n'
+        '正确答案：B\n'
+        '修改为：\n'
+        '## 1.单选题\n'
+        '（）是用于给出项目工作范围的图形文件，包括项目工作包、项目工作包之间的关系以及项目工作包与项目产出物或项目交付物之间的关系。\n'
+        'A. OBS(Organization Breakdown Structure, 组织结构图)\n'
+        'B. WBS(Work Breakdown Structure, 工作分解结构)\n'
+        'C. RBS(Resource Breakdown Structure, 资源分解结构)\n'
+        'D. BOM(Bill of Materials, 物料清单)\n'
+        '正确答案：B\n'
+    ),
+    ('human', "题目的类型是{type}，题目的内容为:{question}")
+]
 
-load_dotenv()
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+chain = None  # 第一次使用时才创建，导入本文件时不加载langchain
 
-model = ChatOpenAI(
-    model=os.getenv("OPENAI_MODEL"),
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    max_tokens=500,
-    temperature=0.1
-)
 
-# system是机器人，human是人类用户
-prompt_template = ChatPromptTemplate.from_messages(
-    [
-        ('system', '现在你是一个项目管理概论老师的助理，你需要帮我整理考试的题目。对于单选题或多选题，你需要补充选项编号（如A、B、C、D），并去掉多余的换行符或多余符号。对于判断题，同样需要去掉多余的换行符。如果是包含一些缩写，在后面添加上注释。以下是一些例子：'
-            '\n\n## 1.单选题\n'
-            '从人类社会整体上来看，下列关于项目与日常运营关系的描述错误的是\n'
-            '项目往往是先于日常运营存在的\n'
-            '日常运营不是以项目为基础的\n'
-            '项目投入需要通过日常运营来回收\n'
-            '广义的项目包含了狭义的项目和日常运营\n'
-            '正确答案：B\n'
-            '修改为：\n'
-            '## 1.单选题\n'
-            '从人类社会整体上来看，下列关于项目与日常运营关系的描述错误的是\n'
-            'A. 项目往往是先于日常运营存在的\n'
-            'B. 日常运营不是以项目为基础的\n'
-            'C. 项目投入需要通过日常运营来回收\n'
-            'D. 广义的项目包含了狭义的项目和日常运营\n'
-            '正确答案：B\n\n'
-            '*********************************\n\n'
-            '## 10.判断题\n'
-            '项目管理的重要工作是从两个方面管理和约束各项目相关利益主体的需求和期望，其一是不要使人们的要求与期望过高而不切实际，其二是努力满足和超越人们的要求与期望。\n'
-            'X\n'
-            '正确答案：正确\n'
-            '修改为：\n'
-            '## 10.判断题\n'
-            '项目管理的重要工作是从两个方面管理和约束各项目相关利益主体的需求和期望，其一是不要使人们的要求与期望过高而不切实际，其二是努力满足和超越人们的要求与期望。\n'
-            '正确答案：正确'
-            '*********************************\n\n'
-            '## 5.单选题\n'
-            ' （）是用于给出项目工作范围的图形文件，包括项目工作包、项目工作包之间的关系以及项目工作包与项目产出物或项目交付物之间的关系。\n'
-            'A. OBS\n'
-            'B. WBS\n'
-            'C. RBS\n'
-            'D. BOM\n'
-            '正确答案：B\n'
-            '修改为：\n'
-            '## 1.单选题\n'
-            '（）是用于给出项目工作范围的图形文件，包括项目工作包、项目工作包之间的关系以及项目工作包与项目产出物或项目交付物之间的关系。\n'
-            'A. OBS(Organization Breakdown Structure, 组织结构图)\n'
-            'B. WBS(Work Breakdown Structure, 工作分解结构)\n'
-            'C. RBS(Resource Breakdown Structure, 资源分解结构)\n'
-            'D. BOM(Bill of Materials, 物料清单)\n'
-            '正确答案：B\n'
-        ),
-        ('human', "题目的类型是{type}，题目的内容为:{question}")
-    ]
-)
-
-
-chain = prompt_template | model
 def polish_by_ai(question:str, type:str):
-    answer = chain.invoke(input = {'type': type, 'question': question})
+    answer = get_chain().invoke(input = {'type': type, 'question': question})
     return answer.content
+
+
+class StubChain:
+    """
+    本地测试用的假模型：不联网，等待delay秒后原样返回题目
+    """
+
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+
+    def invoke(self, input: dict):
+        time.sleep(self.delay)
+        return SimpleNamespace(content=f"## {input['type']}\n{input['question']}")
+
+    async def ainvoke(self, input: dict):
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(content=f"## {input['type']}\n{input['question']}")
+
+
+def get_chain():
+    '''
+    获取整理题目的模型，第一次调用时才导入langchain并创建客户端
+    '''
+    global chain
+    if AI_STUB:
+        return StubChain()
+    if chain is None:
+        from dotenv import load_dotenv
+        from langchain_openai import ChatOpenAI
+        from langchain.prompts import ChatPromptTemplate
+
+        load_dotenv()
+        model = ChatOpenAI(
+            model=os.getenv("OPENAI_MODEL"),
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            max_tokens=500,
+            temperature=0.1
+        )
+        chain = ChatPromptTemplate.from_messages(PROMPT_MESSAGES) | model
+    return chain
+
+
+class AIPipeline:
+    """
+    AI整理题目的流水线：截图识别的线程只负责提交，AI请求在后台事件循环中并发执行，
+    结果按提交顺序写入文件，识别下一题不用等待上一题的AI返回
+    """
+
+    def __init__(self, write, chain=None, concurrency: int = AI_CONCURRENCY,
+                 retries: int = AI_RETRIES, retry_delay: float = AI_RETRY_DELAY):
+        '''
+        :param write: 写入一段文本的函数
+        :param chain: 有ainvoke方法的模型，默认为get_chain()
+        :param concurrency: 同时请求的题目数
+        :param retries: 失败后的重试次数，仍然失败时写入未整理的题目
+        '''
+        self._write = write
+        self._chain = chain or get_chain()
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='ai-pipeline', daemon=True)
+        self._thread.start()
+        self._futures = []
+        self._seq = 0  # 下一个提交的序号
+        self._next_seq = 0  # 下一个要写入的序号
+        self._finished = {}  # 已完成但还没轮到写入的结果 {序号: 文本}
+
+    def put_text(self, text: str):
+        '''
+        提交不需要AI处理的文本（如作业标题），同样按顺序写入
+        '''
+        seq = self._take_seq()
+        self._loop.call_soon_threadsafe(self._done, seq, text)
+
+    def put_question(self, question: str, type: str):
+        '''
+        提交一道题目，立即返回
+        '''
+        seq = self._take_seq()
+        future = asyncio.run_coroutine_threadsafe(self._polish(seq, question, type), self._loop)
+        self._futures.append(future)
+
+    def _take_seq(self) -> int:
+        seq = self._seq
+        self._seq += 1
+        return seq
+
+    async def _polish(self, seq: int, question: str, type: str):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    answer = await self._chain.ainvoke(input={'type': type, 'question': question})
+                    text = answer.content
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        print(f'AI整理失败，写入原始题目: {e}')
+                        text = f'## {type}\n{question}'
+                        break
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        print(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), type, text)
+        self._done(seq, text)
+
+    def _done(self, seq: int, text: str):
+        # 只在事件循环线程中调用，不需要加锁
+        self._finished[seq] = text
+        while self._next_seq in self._finished:
+            self._write(self._finished.pop(self._next_seq))
+            self._next_seq += 1
+
+    def close(self):
+        '''
+        等待所有题目处理并写入完成，然后停止事件循环
+        '''
+        wait(self._futures)
+        # put_text提交的回调在所有题目之后执行完，再停止事件循环
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
 # endregion
 
 # region Common Functions
@@ -122,6 +268,184 @@ def screenshot(region: tuple) -> Image:
     return img
 
 
+def capture_screen() -> Image:
+    """
+    截取整个屏幕，作业名、题目类型、题目都从这一张截图中裁剪
+    """
+    return pg.screenshot()
+
+
+def crop_region(screen: Image, region: tuple) -> Image:
+    """
+    从整屏截图中裁剪出区域
+    :param region: (left, top, width, height)，与pyautogui的region相同
+    """
+    left, top, width, height = region
+    return screen.crop((left, top, left + width, top + height))
+
+
+def capture_region(region: tuple, screen: Image = None) -> Image:
+    """
+    有整屏截图时从中裁剪，否则只截取该区域
+    """
+    if screen is None:
+        return screenshot(region)
+    return crop_region(screen, region)
+
+
+def get_ocr(**kwargs):
+    """
+    获取当前进程的PaddleOCR实例，第一次调用时才加载模型
+    :param kwargs: 覆盖OCR_KWARGS中的参数，只在第一次调用时生效
+    """
+    global OCR
+    if OCR is None:
+        from paddleocr import PaddleOCR
+
+        OCR = PaddleOCR(**{**OCR_KWARGS, **kwargs})
+    return OCR
+
+
+def ocr_image(img) -> list:
+    """
+    直接识别内存中的图片，不再保存为PNG后从磁盘读回
+    :param img: PIL图片或RGB的numpy数组
+    :return: 识别结果[[box, (text, score)], ...]，没有识别到文字时为[]
+    """
+    result = get_ocr().ocr(to_bgr(img), cls=True)
+    return result[0] or []
+
+
+def to_bgr(img) -> np.ndarray:
+    """
+    PaddleOCR按OpenCV的BGR通道顺序处理numpy数组
+    """
+    if isinstance(img, Image.Image):
+        img = img.convert('RGB')
+    return np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+
+
+def ocr_batch(images: list) -> list[list[str]]:
+    """
+    批量识别多张图片
+    检测模型一次只能处理一张图片(各图片尺寸不同)，检测出的文本行裁剪后合并起来，
+    整组只调用一次方向分类和识别，由识别模型按rec_batch_num分批
+    :param images: PIL图片或RGB的numpy数组
+    :return: 每张图片的文本行，与images一一对应
+    """
+    ocr = get_ocr()
+    # paddleocr导入后才能导入它自带的tools包
+    from tools.infer.predict_system import sorted_boxes
+    from tools.infer.utility import get_minarea_rect_crop, get_rotate_crop_image
+
+    crop = get_rotate_crop_image if getattr(ocr.args, 'det_box_type', 'quad') == 'quad' else get_minarea_rect_crop
+    crops, owners = [], []
+    for n, img in enumerate(images):
+        bgr = to_bgr(img)
+        dt_boxes, _ = ocr.text_detector(bgr)
+        if dt_boxes is None:
+            continue
+        for box in sorted_boxes(dt_boxes):
+            crops.append(crop(bgr, copy.deepcopy(box)))
+            owners.append(n)
+
+    results = [[] for _ in images]
+    if not crops:
+        return results
+    if ocr.use_angle_cls:
+        crops, _, _ = ocr.text_classifier(crops)
+    rec_res, _ = ocr.text_recognizer(crops)
+    for n, (text, score) in zip(owners, rec_res):
+        if score >= ocr.drop_score:
+            results[n].append(text)
+    return results
+
+
+def dhash(img: Image, hash_size: int = DHASH_SIZE) -> int:
+    """
+    差值哈希(dHash)：缩小为灰度图后比较相邻像素的明暗，内容不变时哈希不变
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def pixel_digest(img: Image) -> bytes:
+    """
+    区域像素的精确摘要，题号等只差几个字的区域感知哈希可能相同，需要用它确认
+    """
+    return hashlib.blake2b(img.tobytes(), digest_size=16).digest()
+
+
+def region_key(img: Image) -> tuple:
+    """
+    区域的键：(尺寸, 感知哈希, 像素摘要)
+    感知哈希只用于快速筛选，内容是否相同以像素摘要为准
+    """
+    return img.size, dhash(img), pixel_digest(img)
+
+
+class OCRCache:
+    """
+    OCR结果LRU缓存，以尺寸+感知哈希查找，像素摘要一致才算命中，内容没变的区域直接返回上次识别的文字
+    """
+
+    def __init__(self, max_size: int = OCR_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key[:2])
+        if item is None or item[0] != key[2]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key[:2])
+        return item[1]
+
+    def put(self, key, lines: list[str]):
+        self._items[key[:2]] = (key[2], lines)
+        self._items.move_to_end(key[:2])
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+        self.hits = self.misses = 0
+
+
+OCR_CACHE = OCRCache()
+
+
+def ocr_lines(img: Image, cache: OCRCache = OCR_CACHE) -> list[str]:
+    """
+    识别图片中的文本行，相同内容的区域只调用一次PaddleOCR
+    :param cache: 为None时不使用缓存
+    """
+    if cache is None:
+        return [r[1][0] for r in ocr_image(img)]
+    key = region_key(img)
+    lines = cache.get(key)
+    if lines is None:
+        lines = [r[1][0] for r in ocr_image(img)]
+        cache.put(key, lines)
+    return list(lines)
+
+
+def page_changed(last_key, img: Image) -> tuple[bool, tuple]:
+    """
+    用感知哈希判断区域内容是否变化，哈希相同时再比较像素摘要，避免只差题号的题目被当成同一题
+    :return: (是否变化, 当前区域的键)
+    """
+    key = region_key(img)
+    if last_key is None or key[:2] != last_key[:2]:
+        return True, key
+    return key[2] != last_key[2], key
+
+
 def move_and_click(pos: tuple):
     """
     移动鼠标并点击
@@ -152,6 +476,8 @@ def next_homework(url: str):
     """
     move_and_click(BROWER_POS)
     move_and_click(URL_POS)
+    from clipboard import copy
+
     copy(url)
     pg.hotkey("ctrl", "a")
     pg.hotkey("ctrl", "v")
@@ -159,48 +485,41 @@ def next_homework(url: str):
     pg.press("enter")
     sleep(1)
 
-def get_homework(save_dir: str):
+def get_homework(screen: Image = None):
     '''
     获取作业的名字，如果没有则返回None
+    :param screen: 整屏截图，为None时单独截取该区域
     '''
-    
-    save_path = os.path.join(save_dir, f"homework_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.png")
-    img = screenshot(HOMEWORK_REGION)
-    img.save(save_path)
+    img = capture_region(HOMEWORK_REGION, screen)
     try:
-        result = OCR.ocr(save_path, cls=True)
-        return result[0][0][1][0]
+        return ocr_lines(img)[0]
     except Exception as e:
         print(e)
         return None
 
-def get_question_type(save_dir: str):
+def get_question_type(screen: Image = None):
     '''
     获取题目类型
+    :param screen: 整屏截图，为None时单独截取该区域
     '''
-    save_path = os.path.join(save_dir, f"question_type_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.png")
-    img = screenshot(QUESTION_TYPE_REGION)
-    img.save(save_path)
+    img = capture_region(QUESTION_TYPE_REGION, screen)
     try:
-        result = OCR.ocr(save_path, cls=True)
-        qt = result[0][0][1][0]
+        qt = ocr_lines(img)[0]
         # qt = qt.split('.')[-1]
         return qt
     except Exception as e:
         print(e)
         return None
     
-def get_question(save_dir: str):
+def get_question(screen: Image = None):
     '''
     获取题目
+    :param screen: 整屏截图，为None时单独截取该区域
     '''
-    save_path = os.path.join(save_dir, f"question_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.png")
-    img = screenshot(QUESTION_REGION)
-    img.save(save_path)
+    img = capture_region(QUESTION_REGION, screen)
     try:
-        result = OCR.ocr(save_path, cls=True)
-        contents = [r[1][0] for r in result[0]]
-        return contents
+        contents = ocr_lines(img)
+        return contents or None
     except Exception as e:
         print(e)
     
@@ -221,48 +540,243 @@ def homework_url_generator():
         
 # endregion
 
+
+# region 离线批量识别
+def natural_key(path: str):
+    """
+    自然排序的键，如 2.png 排在 10.png 之前
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path.lower())]
+
+
+def find_images(src_dir: str) -> list[str]:
+    """
+    目录下所有图片的相对路径，按自然顺序排列
+    """
+    rel_paths = []
+    for root, _dirs, files in os.walk(src_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                rel_paths.append(os.path.relpath(os.path.join(root, name), src_dir))
+    return sorted(rel_paths, key=natural_key)
+
+
+def file_fingerprint(file_path: str) -> list:
+    """
+    文件大小和修改时间，用来判断图片是否改变
+    """
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _init_ocr_worker(cpu_threads: int):
+    """
+    工作进程初始化：每个进程只加载一次自己的PaddleOCR
+    """
+    get_ocr(cpu_threads=cpu_threads, rec_batch_num=OCR_REC_BATCH_NUM)
+
+
+def _ocr_files(file_paths: list[str]) -> list[tuple[str, list[str], str]]:
+    """
+    在工作进程中识别一组图片，整组的文本行一起送入识别模型(见ocr_batch)
+    :return: [(图片路径, 文本行, 错误信息), ...]
+    """
+    results = {}
+    images = {}
+    for file_path in file_paths:
+        try:
+            with Image.open(file_path) as img:
+                images[file_path] = img.convert('RGB')
+        except Exception as e:
+            results[file_path] = (file_path, [], str(e))
+
+    try:
+        for file_path, lines in zip(images, ocr_batch(list(images.values()))):
+            results[file_path] = (file_path, lines, None)
+    except Exception:
+        # 整组识别失败时逐张重试，只把出错的图片记为失败
+        for file_path, img in images.items():
+            try:
+                results[file_path] = (file_path, ocr_batch([img])[0], None)
+            except Exception as e:
+                results[file_path] = (file_path, [], str(e))
+    return [results[file_path] for file_path in file_paths]
+
+
+def load_ocr_checkpoint(checkpoint_path: str) -> dict:
+    """
+    读取已识别的结果 {相对路径: {'fingerprint':..., 'lines':[...]}}，后写入的记录覆盖先写入的
+    """
+    done = {}
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:  # 上次中断时写了一半的行
+                continue
+            done[record['path']] = record
+    return done
+
+
+def write_ocr_markdown(src_dir: str, rel_paths: list[str], done: dict, save_path: str):
+    """
+    按输入顺序把识别结果写成markdown，每个子目录一个一级标题，每张图片一个二级标题
+    """
+    tmp_path = save_path + '.tmp'
+    current_dir = None
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for rel_path in rel_paths:
+            record = done.get(rel_path)
+            if record is None:
+                continue
+            rel_dir = os.path.dirname(rel_path)
+            if rel_dir != current_dir:
+                current_dir = rel_dir
+                f.write(f'# {rel_dir or os.path.basename(os.path.abspath(src_dir))}\n\n')
+            f.write(f'## {os.path.splitext(os.path.basename(rel_path))[0]}\n')
+            f.write('\n'.join(record['lines']) + '\n\n')
+    os.replace(tmp_path, save_path)
+
+
+def batch_ocr(src_dir: str, save_path: str, workers: int = None, chunk_size: int = OCR_CHUNK_SIZE, force: bool = False) -> dict:
+    '''
+    离线批量识别目录中已截好的题目图片，结果按输入顺序写入markdown
+    图片按chunk_size一组交给工作进程，每个进程有自己的PaddleOCR实例，
+    同一组图片的文本行合并后批量识别(检测仍逐张进行)
+    每组识别完成后立即追加到save_path.jsonl，中断后重新运行会跳过已识别且未改变的图片
+    :param src_dir: 图片所在目录
+    :param save_path: markdown文件路径
+    :param workers: 进程数，默认为CPU核数
+    :param chunk_size: 每次交给工作进程的图片数
+    :param force: 是否忽略已识别的结果，全部重新识别
+    :return: 汇总信息
+    '''
+    workers = workers or os.cpu_count() or 1
+    checkpoint_path = save_path + '.jsonl'
+    if force and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_ocr_checkpoint(checkpoint_path)
+
+    rel_paths = find_images(src_dir)
+    report = {'total': len(rel_paths), 'recognized': 0, 'skipped': 0, 'failed': 0, 'errors': {}}
+    todo = []
+    for rel_path in rel_paths:
+        record = done.get(rel_path)
+        if record is not None and record['fingerprint'] == file_fingerprint(os.path.join(src_dir, rel_path)):
+            report['skipped'] += 1
+        else:
+            done.pop(rel_path, None)
+            todo.append(rel_path)
+
+    if todo:
+        # 每个进程分到的CPU线程数，避免多个PaddleOCR实例互相抢占
+        cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker, initargs=(cpu_threads,)) as executor, \
+                open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            futures = [
+                executor.submit(_ocr_files, [os.path.join(src_dir, rel_path) for rel_path in chunk])
+                for chunk in chunks
+            ]
+            finished = 0
+            for future in as_completed(futures):
+                for file_path, lines, error in future.result():
+                    rel_path = os.path.relpath(file_path, src_dir)
+                    finished += 1
+                    if error is not None:
+                        report['failed'] += 1
+                        report['errors'][rel_path] = error
+                        continue
+                    record = {'path': rel_path, 'fingerprint': file_fingerprint(file_path), 'lines': lines}
+                    done[rel_path] = record
+                    checkpoint.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    report['recognized'] += 1
+                checkpoint.flush()
+                print(f'\r识别进度: {finished}/{len(todo)}', end='', flush=True)
+            print()
+
+    write_ocr_markdown(src_dir, rel_paths, done, save_path)
+    return report
+
+
+def print_ocr_report(report: dict):
+    print(f"共{report['total']}张图片: 识别{report['recognized']}张, 跳过{report['skipped']}张, 失败{report['failed']}张")
+    for rel_path, error in report['errors'].items():
+        print(f'  失败: {rel_path}: {error}')
+# endregion
+
     
-def main():
-    temp_dir = tempfile.TemporaryDirectory()
+def capture_questions():
     save_path = f'雨课堂题目_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.md'
     save_path = '雨课堂题目_20241231143510.md'
     write = partial(write_to_file, save_path=save_path)
-    last_question = None
-    current_question = None
+    # 使用ai补充题目选项和去掉多余的符号，AI请求在后台并发执行，不阻塞截图识别
+    pipeline = AIPipeline(write) if USE_AI else None
+    if pipeline is not None:
+        write = pipeline.put_text  # 标题也经过流水线，保证与题目的顺序一致
+    last_question = None  # 上一题题目区域的哈希键
     try:
         for url in homework_url_generator():
             next_homework(url)
-            homework_name = get_homework(save_dir=temp_dir.name)
+            # 每次只截一次整屏，各区域从中裁剪后直接在内存中识别
+            screen = capture_screen()
+            homework_name = get_homework(screen)
             if is_homework(homework_name):
                 continue
             write(f'# {homework_name}')
-            current_question = screenshot(QUESTION_REGION)
-            while current_question != last_question:
-                qt = get_question_type(save_dir=temp_dir.name)
-                q = get_question(save_dir=temp_dir.name)
+            # 题目区域的感知哈希不变，说明已经是最后一题（点击“下一题”没有翻页）
+            changed, current_question = page_changed(last_question, crop_region(screen, QUESTION_REGION))
+            while changed:
+                qt = get_question_type(screen)
+                q = get_question(screen)
                 
                 if qt is None or q is None:
+                    screen = capture_screen()
                     continue
                 
                 q = "\n".join(q)
-                # 使用ai补充题目选项和去掉多余的符号
-                if USE_AI:
-                    q = polish_by_ai(q, qt)
-                    print(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), qt, q)
-                    write(f'{q}')
+                if pipeline is not None:
+                    pipeline.put_question(q, qt)
                 else:
                     write(f'## {qt}')
                     write(q)
                 last_question = current_question
                 next_question()
                 sleep(1)
-                current_question = screenshot(QUESTION_REGION)
-            
+                screen = capture_screen()
+                changed, current_question = page_changed(last_question, crop_region(screen, QUESTION_REGION))
     finally:
-        temp_dir.cleanup()
-    
-        
+        if pipeline is not None:
+            pipeline.close()
         
-    print('ok')
+    print(f'ok, OCR缓存命中{OCR_CACHE.hits}次, 未命中{OCR_CACHE.misses}次')
+
+
+def main(argv: list[str] = None):
+    '''
+    不带参数时截屏识别雨课堂题目；batch子命令离线识别图片目录
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='使用ocr提取雨课堂的题目')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('capture', help='截屏识别雨课堂题目（默认）')
+    batch = commands.add_parser('batch', help='离线识别目录中已截好的题目图片')
+    batch.add_argument('src_dir', help='图片所在目录')
+    batch.add_argument('save_path', help='保存识别结果的markdown文件')
+    batch.add_argument('-j', '--workers', type=int, default=None, help='进程数，默认为CPU核数')
+    batch.add_argument('--chunk-size', type=int, default=OCR_CHUNK_SIZE, help='每次交给工作进程的图片数')
+    batch.add_argument('--force', action='store_true', help='忽略已识别的结果，全部重新识别')
+    args = parser.parse_args(argv)
+
+    if args.command != 'batch':
+        capture_questions()
+        return 0
+    report = batch_ocr(args.src_dir, args.save_path, workers=args.workers, chunk_size=args.chunk_size, force=args.force)
+    print_ocr_report(report)
+    return 1 if report['failed'] else 0
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file
@@ -5,67 +5,169 @@
 
 import os
 import re
+import posixpath
+import json
+import hashlib
+import zipfile
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import xml.etree.ElementTree as ET
-from .zip_helper import unzip_to_temp
 
-def filter_notes(notes_dir)->list[tuple[int, str]]:
+NOTES_PREFIX = 'ppt/notesSlides/'
+A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+P_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+NOTES_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+MANIFEST_FILE = '.ppt_notes_manifest.json' # 批量转换的清单文件，位于输出目录下
+
+def _rels_path(part:str)->str:
     '''
-    过滤notes目录下xml文件
-    :param notes_dir: notes目录路径
-    :return: 包含文件名和序号的元组列表
+    获取部件对应的.rels文件路径，如ppt/slides/slide1.xml -> ppt/slides/_rels/slide1.xml.rels
+    '''
+    dir_name, base_name = posixpath.split(part)
+    return posixpath.join(dir_name, '_rels', base_name + '.rels')
+
+def _read_rels(zip_ref:zipfile.ZipFile, part:str)->dict[str, tuple[str, str]]:
+    '''
+    读取部件的关系
+    :return: {关系Id: (关系类型, 目标部件路径)}
+    '''
+    try:
+        with zip_ref.open(_rels_path(part)) as f:
+            root = ET.parse(f).getroot()
+    except KeyError:
+        return {}
+    base_dir = posixpath.dirname(part)
+    rels = {}
+    for rel in root.iter(REL_NS + 'Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(base_dir, target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
+
+def resolve_notes_order(zip_ref:zipfile.ZipFile)->dict[str, int]:
+    '''
+    根据ppt/presentation.xml和关系文件解析每个notesSlide对应的幻灯片位置，
+    幻灯片在PowerPoint中调整过顺序后，notesSlide的文件名序号不再等于幻灯片位置
+    :param zip_ref: 打开的pptx压缩包
+    :return: {notesSlide成员名: 幻灯片位置(从1开始)}，没有presentation.xml时返回空字典
+    '''
+    presentation = 'ppt/presentation.xml'
+    try:
+        with zip_ref.open(presentation) as f:
+            root = ET.parse(f).getroot()
+    except KeyError:
+        return {}
+
+    presentation_rels = _read_rels(zip_ref, presentation)
+    index = {}
+    for position, sld_id in enumerate(root.iter(P_NS + 'sldId'), start=1):
+        rel = presentation_rels.get(sld_id.get(R_NS + 'id'))
+        if rel is None:
+            continue
+        for rel_type, target in _read_rels(zip_ref, rel[1]).values():
+            if rel_type == NOTES_REL_TYPE:
+                index[target] = position
+                break
+    return index
+
+def filter_note_members(names:list[str])->list[tuple[int, str]]:
+    '''
+    过滤压缩包中ppt/notesSlides/下的xml文件
+    :param names: 压缩包中的成员名列表
+    :return: 包含序号和成员名的元组列表
     '''
-    files = [f for f in os.listdir(notes_dir) if f.endswith('.xml')]
-    
     results = []
-    
-    for file in files:
-        number = int(re.findall(r'\d+', file)[-1])
-        results.append((number, file))
+    for name in names:
+        if not name.startswith(NOTES_PREFIX) or not name.endswith('.xml'):
+            continue
+        if '/' in name[len(NOTES_PREFIX):]: # 跳过_rels等子目录
+            continue
+        number = int(re.findall(r'\d+', os.path.basename(name))[-1])
+        results.append((number, name))
     
     results = sorted(results, key=lambda x: x[0])
     return results
 
-def extract_text(element):
+def iter_note_paragraphs(source):
     '''
-    提取xml元素中的文本
-    :param element: xml元素
-    :return: 元素中的文本列表
+    流式解析notesSlide，只提取备注正文占位符(p:ph type="body")中的a:t文本，
+    幻灯片缩略图、页码等占位符中的文本会被忽略
+    :param source: xml文件路径或文件对象
+    :return: 逐段返回备注文本
     '''
-    texts = []
-    if element.text:
-        texts.append(element.text)
-    for child in element:
-        texts.extend(extract_text(child))
-    if element.tail:
-        texts.append(element.tail)
-        
-    texts = [a for a in texts if len(a.strip()) > 0]
-    return texts
+    in_body = False # 当前p:sp是否为备注正文
+    parts = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == P_NS + 'sp':
+                in_body = False
+            elif tag == P_NS + 'ph' and elem.get('type') == 'body':
+                in_body = True
+            continue
+
+        if in_body:
+            if tag == A_NS + 't':
+                if elem.text:
+                    parts.append(elem.text)
+            elif tag == A_NS + 'br':
+                parts.append('\n')
+            elif tag == A_NS + 'p':
+                yield ''.join(parts)
+                parts.clear()
+        if tag == P_NS + 'sp':
+            in_body = False
+            elem.clear()
+
+def extract_notes_text(source, sep:str='\n')->str:
+    '''
+    提取notesSlide中的备注文本，段落之间用sep分隔
+    :param source: xml文件路径或文件对象
+    :param sep: 段落分隔符
+    :return: 备注文本
+    '''
+    return sep.join(iter_note_paragraphs(source)).strip()
 
 def extract_ppt_notes(ppt_file_path)->str:
     '''
-    提取ppt文件中的注释
+    提取ppt文件中的注释，直接从压缩包中读取notesSlides，不解压整个文件
+    注释按幻灯片在演示文稿中的实际顺序排列
     :param ppt_file_path: ppt文件路径
     :return: 注释列表
     '''
     results = []
-    with unzip_to_temp(ppt_file_path) as temp_dir:
-        notes_dir = os.path.join(temp_dir, 'ppt', 'notesSlides')
-        if not os.path.exists(notes_dir):
-            return results
+    with zipfile.ZipFile(ppt_file_path, 'r') as zip_ref:
+        notes_order = resolve_notes_order(zip_ref)
+        if notes_order:
+            note_members = sorted((number, name) for name, number in notes_order.items())
         else:
-            note_files = filter_notes(notes_dir)
-            for number, file in note_files:
-                ppt_file_path = os.path.join(notes_dir, file)
-                tree = ET.parse(ppt_file_path)
-                root = tree.getroot()
-                texts = extract_text(root)
-                text = ''.join(texts)
-                if len(text) > 0:
-                    results.append((number, text))
+            note_members = filter_note_members(zip_ref.namelist())
+        for number, name in note_members:
+            with zip_ref.open(name) as f:
+                text = extract_notes_text(f)
+            if len(text) > 0:
+                results.append((number, text))
     return results
 
+def write_notes_md(notes:list[tuple[int, str]], save_path:str)->str:
+    '''
+    把注释写入markdown文件
+    :param notes: 注释列表
+    :param save_path: markdown文件路径
+    :return: markdown文件路径
+    '''
+    with open(save_path, 'w', encoding='utf-8') as f:
+        for number, text in notes:
+            f.write(f'## Slide {number}\n\n{text}\n\n')
+    return save_path
+
 def ppt_notes2md(file_path:str, save_dir:str)->str:
     '''
     ppt文件中的注释转为markdown文件
@@ -78,8 +180,132 @@ def ppt_notes2md(file_path:str, save_dir:str)->str:
     
     notes = extract_ppt_notes(file_path)
     assert len(notes) > 0, f'在{file_path}中没有找到任何注释'
-    with open(save_path, 'w', encoding='utf-8') as f:
-        for number, text in notes:
-            f.write(f'## Slide {number}\n\n{text}\n\n')
-            
-    return save_path
\ No newline at end of file
+    return write_notes_md(notes, save_path)
+
+# region 批量转换
+def file_hash(file_path:str)->str:
+    '''
+    计算文件内容的sha256
+    '''
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def find_decks(src_dir:str)->list[str]:
+    '''
+    递归查找目录下的pptx文件，跳过office的临时文件(~$开头)
+    :return: 相对于src_dir的路径列表
+    '''
+    decks = []
+    for root, dirs, files in os.walk(src_dir):
+        for file in files:
+            if file.lower().endswith('.pptx') and not file.startswith('~$'):
+                decks.append(os.path.relpath(os.path.join(root, file), src_dir))
+    return sorted(decks)
+
+def _convert_deck(src_path:str, save_path:str)->tuple[str, int]:
+    '''
+    进程池中执行的转换任务
+    :return: (状态, 注释页数)
+    '''
+    notes = extract_ppt_notes(src_path)
+    if len(notes) == 0:
+        return 'empty', 0
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    write_notes_md(notes, save_path)
+    return 'converted', len(notes)
+
+def save_manifest(manifest:dict, manifest_path:str):
+    '''
+    先写临时文件再替换，中途中断也不会留下损坏的清单
+    '''
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def batch_ppt_notes2md(src_dir:str, save_dir:str, workers:int=None, force:bool=False)->dict:
+    '''
+    批量把目录下所有ppt的注释转为markdown文件，输出目录保持与源目录相同的结构
+    内容哈希与上次运行相同的ppt会被跳过，清单保存在save_dir/.ppt_notes_manifest.json
+    每完成一个ppt就写入一次清单，中途中断时已完成的ppt下次不会重新转换
+    :param src_dir: ppt文件所在目录
+    :param save_dir: 保存markdown文件的目录
+    :param workers: 进程数，默认为CPU核数
+    :param force: 是否忽略清单，全部重新转换
+    :return: 汇总信息
+    '''
+    os.makedirs(save_dir, exist_ok=True)
+    manifest_path = os.path.join(save_dir, MANIFEST_FILE)
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    report = {'total': 0, 'converted': 0, 'skipped': 0, 'empty': 0, 'failed': 0, 'errors': {}}
+    tasks = {}
+    for rel_path in find_decks(src_dir):
+        report['total'] += 1
+        src_path = os.path.join(src_dir, rel_path)
+        save_path = os.path.join(save_dir, os.path.splitext(rel_path)[0] + '.md')
+        digest = file_hash(src_path)
+        record = manifest.get(rel_path)
+        if record is not None and record['hash'] == digest and (record['status'] == 'empty' or os.path.exists(save_path)):
+            report['skipped'] += 1
+            continue
+        tasks[rel_path] = (src_path, save_path, digest)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_convert_deck, src_path, save_path): rel_path
+            for rel_path, (src_path, save_path, digest) in tasks.items()
+        }
+        for future in as_completed(futures):
+            rel_path = futures[future]
+            src_path, save_path, digest = tasks[rel_path]
+            try:
+                status, pages = future.result()
+            except Exception as e:
+                report['failed'] += 1
+                report['errors'][rel_path] = str(e)
+                manifest.pop(rel_path, None)
+            else:
+                report[status] += 1
+                manifest[rel_path] = {
+                    'hash': digest,
+                    'status': status,
+                    'output': os.path.relpath(save_path, save_dir) if status == 'converted' else None,
+                    'pages': pages,
+                }
+            save_manifest(manifest, manifest_path)
+
+    save_manifest(manifest, manifest_path)
+    return report
+
+def print_report(report:dict):
+    '''
+    打印批量转换的汇总信息
+    '''
+    print(f"共{report['total']}个ppt: 转换{report['converted']}个, 跳过{report['skipped']}个, "
+          f"无注释{report['empty']}个, 失败{report['failed']}个")
+    for rel_path, error in report['errors'].items():
+        print(f'  失败: {rel_path}: {error}')
+
+def main(argv:list[str]=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='批量提取ppt注释并转为markdown文件')
+    parser.add_argument('src_dir', help='ppt文件所在目录')
+    parser.add_argument('save_dir', help='保存markdown文件的目录')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='进程数，默认为CPU核数')
+    parser.add_argument('--force', action='store_true', help='忽略清单，全部重新转换')
+    args = parser.parse_args(argv)
+
+    report = batch_ppt_notes2md(args.src_dir, args.save_dir, workers=args.workers, force=args.force)
+    print_report(report)
+    return 1 if report['failed'] else 0
+# endregion
+
+if __name__ == '__main__':
+    raise SystemExit(main())
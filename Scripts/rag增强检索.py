@@ -1,42 +1,67 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-import pandas as pd
-# from langchain_community.vectorstores import Chroma
-from langchain_chroma import Chroma
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 import datetime
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.schema.runnable import RunnableParallel, RunnablePassthrough
-from langchain import hub
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-    HumanMessagePromptTemplate,
-    PromptTemplate,
-)
+
+# langchain、chroma、pandas等在用到的函数中才导入，list等子命令不会加载它们
+if TYPE_CHECKING:
+    # from langchain_community.vectorstores import Chroma
+    from langchain_chroma import Chroma
 
 
 BASE_DIR = "vectorstore"
 QUESTION_KW = "question"
 MAX_TOKENS = 1e6 # max_completion_tokens
+MANIFEST_FILE = "manifest.json" # 向量库元数据清单，位于BASE_DIR下
+MAX_OPEN_STORES = 8 # 同时保持打开的Chroma客户端数量上限
+CHECKPOINT_DIR = ".embedding_checkpoints" # Embedding断点续传目录，不能放在BASE_DIR下，否则会被当成向量库
+
+# region 全局变量: Embedding请求
+EMBED_BATCH_TOKENS = 8000 # 每个请求的最大token数
+EMBED_BATCH_SIZE = 512 # 每个请求的最大文本数
+EMBED_CONCURRENCY = 4 # 并发请求数
+EMBED_RPM = 3000 # 每分钟最大请求数
+EMBED_TPM = 1_000_000 # 每分钟最大token数
+EMBED_MAX_RETRIES = 6 # 单个批次的最大重试次数
+# endregion
 
 # region common
 def get_embeddings():
     """
     获取Embedding模型
     """
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+
+    load_dotenv()
     return OpenAIEmbeddings(
         api_key=os.getenv("EMBEDDING_API_KEY"),
     )
 
 
+def get_embedding_model_name(embeddings=None) -> str:
+    """
+    获取Embedding模型名称，用于写入向量库清单
+    """
+    if embeddings is None:
+        embeddings = get_embeddings()
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
 def get_llm():
     """
     获取OpenAI语言模型
     """
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI
+
+    load_dotenv()
     return ChatOpenAI(
         model=os.getenv("OPENAI_MODEL"),
         api_key=os.getenv("OPENAI_API_KEY"),
@@ -48,12 +73,273 @@ def get_llm():
 # endregion
 
 
+# region Embedding
+class RateLimiter:
+    """
+    令牌桶限流器，同时限制每分钟请求数和每分钟token数
+    """
+
+    def __init__(self, rpm: int = EMBED_RPM, tpm: int = EMBED_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int):
+        """
+        阻塞直到可以发送一个包含tokens个token的请求
+        """
+        tokens = min(tokens, self.tpm)  # 超过上限的批次只能等桶满后发送
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                )
+            time.sleep(max(wait, 0.01))
+
+
+class PrecomputedEmbeddings:
+    """
+    使用已计算好的向量，交给Chroma.from_texts写库时不会重复请求Embedding接口
+    """
+
+    def __init__(self, texts: list[str], vectors: list[list[float]], embeddings=None):
+        self._vectors = dict(zip(texts, vectors))
+        self._embeddings = embeddings
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        missing = [text for text in texts if text not in self._vectors]
+        if missing:
+            if self._embeddings is None:
+                raise ValueError("没有可用于计算新文本的Embedding模型")
+            self._vectors.update(zip(missing, self._embeddings.embed_documents(missing)))
+        return [self._vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        if self._embeddings is None:
+            raise ValueError("没有可用于查询的Embedding模型")
+        return self._embeddings.embed_query(text)
+
+
+class EmbeddingDispatcher:
+    """
+    批量Embedding请求调度器
+
+    - 按token数把文本打包成批次
+    - 多个批次并发请求，受每分钟请求数/token数限制，失败时指数退避重试
+    - 已完成的批次写入断点文件，中断后重新运行会跳过这些批次
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        batch_tokens: int = EMBED_BATCH_TOKENS,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        rpm: int = EMBED_RPM,
+        tpm: int = EMBED_TPM,
+        max_retries: int = EMBED_MAX_RETRIES,
+        checkpoint_dir: str = CHECKPOINT_DIR,
+    ):
+        """
+        - param embeddings: Embedding模型，为空时使用get_embeddings()获取
+        - param batch_tokens: 每个请求的最大token数
+        - param batch_size: 每个请求的最大文本数
+        - param concurrency: 并发请求数
+        - param rpm: 每分钟最大请求数
+        - param tpm: 每分钟最大token数
+        - param max_retries: 单个批次的最大重试次数
+        - param checkpoint_dir: 断点文件目录，为None时不保存断点
+        """
+        self.embeddings = embeddings if embeddings is not None else get_embeddings()
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.checkpoint_dir = checkpoint_dir
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self._encoding = self._get_encoding()
+
+    def _get_encoding(self):
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            return tiktoken.encoding_for_model(get_embedding_model_name(self.embeddings))
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, text: str) -> int:
+        """
+        估计文本的token数，没有tiktoken时按字符数估计(对中文偏保守)
+        """
+        if self._encoding is None:
+            return len(text)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def make_batches(self, texts: list[str]) -> list[tuple[int, int, int]]:
+        """
+        按顺序把文本打包成批次
+        - return: (起始下标, 结束下标, token数)的列表
+        """
+        batches = []
+        start, tokens = 0, 0
+        for i, text in enumerate(texts):
+            n = self.count_tokens(text)
+            if i > start and (tokens + n > self.batch_tokens or i - start >= self.batch_size):
+                batches.append((start, i, tokens))
+                start, tokens = i, 0
+            tokens += n
+        if start < len(texts):
+            batches.append((start, len(texts), tokens))
+        return batches
+
+    def checkpoint_path(self, texts: list[str]) -> str:
+        """
+        断点文件路径，由模型名称、分批参数和全部文本内容决定
+        """
+        h = hashlib.sha256(get_embedding_model_name(self.embeddings).encode("utf-8"))
+        h.update(f"{self.batch_size}:{self.batch_tokens}".encode("utf-8"))
+        for text in texts:
+            h.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return os.path.join(self.checkpoint_dir, f"{h.hexdigest()[:32]}.jsonl")
+
+    def _load_checkpoint(self, path: str) -> dict[tuple[int, int], list]:
+        done = {}
+        if path is None or not os.path.exists(path):
+            return done
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # 最后一行可能在写入时中断
+                if "end" not in record or len(record["vectors"]) != record["end"] - record["start"]:
+                    continue  # 旧格式或不完整的记录，重新计算
+                done[(record["start"], record["end"])] = record["vectors"]
+        return done
+
+    def _embed_batch(self, batch: list[str], tokens: int) -> list[list[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = min(60, 2**attempt) + random.random()
+                print(f"Embedding请求失败，{wait:.1f}秒后重试({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(wait)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        计算所有文本的向量，顺序与texts一致
+        """
+        path = None
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            path = self.checkpoint_path(texts)
+        done = self._load_checkpoint(path)
+        batches = self.make_batches(texts)
+        # 只保留与本次分批一致的记录
+        done = {b[:2]: done[b[:2]] for b in batches if b[:2] in done}
+        batches = [b for b in batches if b[:2] not in done]
+        if done:
+            print(f"从断点恢复: 已完成{len(done)}个批次，剩余{len(batches)}个批次")
+
+        lock = threading.Lock()
+        f = open(path, "a", encoding="utf-8") if path is not None else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {
+                    executor.submit(self._embed_batch, texts[start:end], tokens): (start, end)
+                    for start, end, tokens in batches
+                }
+                for future in as_completed(futures):
+                    start, end = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception:
+                        # 已完成的批次都在断点文件中，取消剩余批次后直接退出
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise
+                    with lock:
+                        done[(start, end)] = vectors
+                        if f is not None:
+                            f.write(json.dumps({"start": start, "end": end, "vectors": vectors}) + "\n")
+                            f.flush()
+        finally:
+            if f is not None:
+                f.close()
+
+        results = []
+        for key in sorted(done):
+            results.extend(done[key])
+        assert len(results) == len(texts), f"向量数{len(results)}与文本数{len(texts)}不一致"
+        return results
+
+    def clear_checkpoint(self, texts: list[str]):
+        """
+        数据写入成功后删除断点文件
+        """
+        if self.checkpoint_dir is None:
+            return
+        path = self.checkpoint_path(texts)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def embed_to_chroma(texts: list[str], persist_directory: str, metadatas: list[dict] = None, dispatcher: EmbeddingDispatcher = None):
+    """
+    通过EmbeddingDispatcher计算向量并写入chroma数据库
+    - param texts: 文本列表
+    - param persist_directory: 数据库文件夹路径
+    - param metadatas: 每条文本的元数据
+    - param dispatcher: Embedding调度器，为空时使用默认参数创建
+    """
+    from langchain_chroma import Chroma
+
+    if dispatcher is None:
+        dispatcher = EmbeddingDispatcher()
+    vectors = dispatcher.embed(texts)
+    vectorstore = Chroma.from_texts(
+        texts=texts,
+        embedding=PrecomputedEmbeddings(texts, vectors, dispatcher.embeddings),
+        metadatas=metadatas,
+        persist_directory=persist_directory,
+    )
+    dispatcher.clear_checkpoint(texts)
+    return vectorstore
+
+
+# endregion
+
+
 # region Chroma
-def create_db_from_df(file_path: str):
+def create_db_from_df(file_path: str, dispatcher: EmbeddingDispatcher = None):
     """
     从excel或csv文件中读取数据，并创建chroma数据库
     - param file_path: 文件路径
+    - param dispatcher: Embedding调度器，为空时使用默认参数创建
     """
+    import pandas as pd
+
     if file_path.endswith(".csv"):
         df = pd.read_csv(file_path)
     elif file_path.endswith(".xlsx") or file_path.endswith(".xls"):
@@ -73,26 +359,44 @@ def create_db_from_df(file_path: str):
             text += f"{col}: {row[col]}\n"
         texts.append(text)
 
-    vectorstore = Chroma.from_texts(
-        texts=texts,
-        embedding=get_embeddings(),
-        persist_directory=f"./{BASE_DIR}/df_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+    if dispatcher is None:
+        dispatcher = EmbeddingDispatcher()
+    persist_directory = f"./{BASE_DIR}/df_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+    vectorstore = embed_to_chroma(texts, persist_directory, dispatcher=dispatcher)
+    StoreRegistry().register(
+        persist_directory,
+        source=file_path,
+        doc_count=len(texts),
+        embedding_model=get_embedding_model_name(dispatcher.embeddings),
     )
     return vectorstore
 
 
-def create_db_from_pdf(file_path: str):
+def create_db_from_pdf(file_path: str, dispatcher: EmbeddingDispatcher = None):
     """
     从pdf文件中读取数据，并创建chroma数据库
     - param file_path: 文件路径
+    - param dispatcher: Embedding调度器，为空时使用默认参数创建
     """
+    from langchain_community.document_loaders import PyMuPDFLoader
+
     pdf_loader = PyMuPDFLoader(file_path)
     docs = pdf_loader.load_and_split()
 
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=get_embeddings(),
-        persist_directory=f"./{BASE_DIR}/pdf_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+    if dispatcher is None:
+        dispatcher = EmbeddingDispatcher()
+    persist_directory = f"./{BASE_DIR}/pdf_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+    vectorstore = embed_to_chroma(
+        [doc.page_content for doc in docs],
+        persist_directory,
+        metadatas=[doc.metadata for doc in docs],
+        dispatcher=dispatcher,
+    )
+    StoreRegistry().register(
+        persist_directory,
+        source=file_path,
+        doc_count=len(docs),
+        embedding_model=get_embedding_model_name(dispatcher.embeddings),
     )
     return vectorstore
 
@@ -102,22 +406,51 @@ def load_chroma_db(db_dir: str):
     从文件夹中加载chroma数据库
     - param db_dir: 数据库文件夹路径
     """
+    from langchain_chroma import Chroma
 
     vectorstore = Chroma(persist_directory=db_dir, embedding_function=get_embeddings())
 
     return vectorstore
 
 
+def _system_cache(client) -> dict:
+    """
+    chromadb按路径缓存PersistentClient的System(SharedSystemClient._identifier_to_system)
+    """
+    for cls in type(client).__mro__:
+        if "_identifier_to_system" in vars(cls):
+            return vars(cls)["_identifier_to_system"]
+    return {}
+
+
+def close_chroma_db(db: "Chroma"):
+    """
+    停止数据库的System并从chromadb的缓存中移除，释放其占用的内存和文件句柄
+    """
+    client = getattr(db, "_client", None)
+    system = getattr(client, "_system", None)
+    if system is None:
+        return
+    try:
+        system.stop()
+    finally:
+        cache = _system_cache(client)
+        for identifier in [k for k, v in cache.items() if v is system]:
+            del cache[identifier]
+
+
 def load_all_chroma_db(base_dir: str = BASE_DIR):
     """
     从根目录中加载所有chroma数据库
     - param base_dir: 根目录
+
+    会一次性打开所有数据库，数据库较多时建议使用StoreRegistry按需加载
     """
 
     db_dirs = [
         os.path.join(base_dir, db_dir)
         for db_dir in os.listdir(base_dir)
-        if os.path.isdir(os.path.join(base_dir, db_dir))
+        if not db_dir.startswith(".") and os.path.isdir(os.path.join(base_dir, db_dir))
     ]
 
     dbs = []
@@ -125,15 +458,179 @@ def load_all_chroma_db(base_dir: str = BASE_DIR):
         try:
             db = load_chroma_db(db_dir)
             dbs.append(db)
-        except:
-            print(f"加载{db_dir}失败")
+        except Exception as e:
+            print(f"加载{db_dir}失败: {e}")
     return dbs
 
 
-def combine_dbs_to_retriver(dbs: list[Chroma]):
+class StoreRegistry:
+    """
+    向量库注册表
+
+    - 元数据(来源、文档数、Embedding模型)保存在BASE_DIR/manifest.json中
+    - 数据库在第一次使用时才打开，打开的客户端保存在有上限的LRU池中
+    - 查询时可以只指定部分数据库，其余数据库不会被打开
+    """
+
+    def __init__(self, base_dir: str = BASE_DIR, max_open: int = MAX_OPEN_STORES):
+        """
+        - param base_dir: 根目录
+        - param max_open: 同时保持打开的数据库数量上限
+        """
+        if max_open < 1:
+            raise ValueError("max_open必须大于0")
+        self.base_dir = base_dir
+        self.max_open = max_open
+        self.manifest_path = os.path.join(base_dir, MANIFEST_FILE)
+        self._pool: "OrderedDict[str, Chroma]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._embeddings = None
+
+    # region manifest
+    def load_manifest(self) -> dict:
+        """
+        读取清单，清单中没有的子目录会以空元数据补充进来，跳过以.开头的目录
+        """
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+        if os.path.isdir(self.base_dir):
+            for name in os.listdir(self.base_dir):
+                if name.startswith(".") or name in manifest:
+                    continue
+                if os.path.isdir(os.path.join(self.base_dir, name)):
+                    manifest[name] = {"source": None, "doc_count": None, "embedding_model": None}
+        return manifest
+
+    def save_manifest(self, manifest: dict):
+        """
+        写入清单，先写临时文件再替换，避免写到一半中断导致清单损坏
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def register(self, db_dir: str, source: str = None, doc_count: int = None, embedding_model: str = None):
+        """
+        登记一个数据库的元数据
+        - param db_dir: 数据库文件夹路径或名称
+        - param source: 数据来源文件
+        - param doc_count: 文档数量
+        - param embedding_model: Embedding模型名称
+        """
+        name = os.path.basename(os.path.normpath(db_dir))
+        with self._lock:
+            manifest = self.load_manifest()
+            manifest[name] = {
+                "source": source,
+                "doc_count": doc_count,
+                "embedding_model": embedding_model,
+                "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.save_manifest(manifest)
+        return name
+
+    def list_stores(self, **filters) -> list[str]:
+        """
+        列出数据库名称，可按元数据过滤，如list_stores(embedding_model="text-embedding-3-small")
+        """
+        manifest = self.load_manifest()
+        return [
+            name
+            for name, meta in manifest.items()
+            if all(meta.get(k) == v for k, v in filters.items())
+        ]
+
+    # endregion
+
+    # region pool
+    def get(self, name: str) -> "Chroma":
+        """
+        获取数据库，未打开时才打开，超过上限时关闭最久未使用的数据库
+        - param name: 数据库名称(BASE_DIR下的子目录名)
+        """
+        with self._lock:
+            if name in self._pool:
+                self._pool.move_to_end(name)
+                return self._pool[name]
+
+        db_dir = os.path.join(self.base_dir, name)
+        if not os.path.isdir(db_dir):
+            raise FileNotFoundError(f"数据库不存在: {db_dir}")
+        from langchain_chroma import Chroma
+
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        db = Chroma(persist_directory=db_dir, embedding_function=self._embeddings)
+
+        evicted = []
+        with self._lock:
+            # 其他线程可能已经打开了同一个数据库
+            if name in self._pool:
+                # 同一路径的客户端共用一个System，不能关闭，直接丢弃即可
+                self._pool.move_to_end(name)
+                return self._pool[name]
+            self._pool[name] = db
+            while len(self._pool) > self.max_open:
+                evicted.append(self._pool.popitem(last=False)[1])
+        for old in evicted:
+            close_chroma_db(old)
+        return db
+
+    def open_stores(self) -> list[str]:
+        """
+        当前已打开的数据库名称，按最近使用顺序排列
+        """
+        with self._lock:
+            return list(self._pool.keys())
+
+    def clear(self):
+        """
+        关闭所有已打开的数据库
+        """
+        with self._lock:
+            dbs = list(self._pool.values())
+            self._pool.clear()
+        for db in dbs:
+            close_chroma_db(db)
+
+    # endregion
+
+    def as_retriever(self, names: list[str] = None, **kwargs):
+        """
+        返回组合Retriever，数据库在查询时才打开
+        - param names: 参与查询的数据库名称，为空时使用清单中的全部数据库
+        - param kwargs: 传给Chroma.as_retriever的参数
+        """
+        from langchain.schema.runnable import RunnableParallel
+
+        if names is None:
+            names = self.list_stores()
+
+        def retrieve(x):
+            docs = []
+            for name in names:
+                try:
+                    db = self.get(name)
+                except Exception as e:
+                    print(f"加载{name}失败: {e}")
+                    continue
+                docs.extend(db.as_retriever(**kwargs).invoke(x[QUESTION_KW]))
+            return docs
+
+        return RunnableParallel(context=retrieve)
+
+
+def combine_dbs_to_retriver(dbs: list["Chroma"]):
     """
     组合多个Chroma数据库，返回Retriever
     """
+    from langchain.schema.runnable import RunnableParallel
+
     retrievers = [db.as_retriever() for db in dbs]
 
     combined_retriever = RunnableParallel(
@@ -162,6 +659,12 @@ def get_prompt():
     '''
     获取提示词
     '''
+    from langchain_core.prompts import (
+        ChatPromptTemplate,
+        HumanMessagePromptTemplate,
+        PromptTemplate,
+    )
+
     return ChatPromptTemplate(
         input_variables=["context", "question"],
         input_types={},
@@ -205,6 +708,9 @@ def get_rag_chain(
     - param question_kw: 问题关键字，默认为'question'
     - param format_func: 格式化context的函数
     """
+    from langchain.schema.runnable import RunnablePassthrough
+    from langchain_core.output_parsers import StrOutputParser
+
     if prompt is None:
         # prompt = hub.pull("rlm/rag-prompt")
         prompt = get_prompt()
@@ -232,3 +738,42 @@ def ask_question(question, rag_chain, question_kw=QUESTION_KW):
     return answer
 
 # endregion
+
+
+def main(argv: list[str] = None):
+    """
+    命令行入口
+    - build: 从csv/excel/pdf文件创建向量库
+    - list: 列出清单中的向量库
+    - ask: 在指定(默认全部)向量库中检索并回答问题
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RAG增强检索")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="从csv/excel/pdf文件创建向量库")
+    build.add_argument("file_path", help="数据文件路径")
+    commands.add_parser("list", help="列出向量库")
+    ask = commands.add_parser("ask", help="提问")
+    ask.add_argument("question", help="问题")
+    ask.add_argument("--stores", default=None, help="参与检索的向量库名称，逗号分隔，默认全部")
+    args = parser.parse_args(argv)
+
+    registry = StoreRegistry()
+    if args.command == "build":
+        if args.file_path.lower().endswith(".pdf"):
+            create_db_from_pdf(args.file_path)
+        else:
+            create_db_from_df(args.file_path)
+    elif args.command == "list":
+        for name, meta in registry.load_manifest().items():
+            print(name, meta)
+    else:
+        names = args.stores.split(",") if args.stores else None
+        rag_chain = get_rag_chain(registry.as_retriever(names))
+        print(ask_question(args.question, rag_chain))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,26 +2,208 @@ import tempfile
 import zipfile
 import os
 import shutil
+import fnmatch
+import heapq
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+RAM_DIR = '/dev/shm'  # Linux 下基于内存的 tmpfs 目录
+
+def shard_members(infos, workers):
+    """
+    按压缩后大小把成员分配给各个线程，从大到小依次分给当前负载最小的线程
+
+    :param infos: ZipInfo 列表
+    :param workers: 线程数
+    :return: 每个线程负责的成员名列表
+    """
+    shards = [[] for _ in range(workers)]
+    heap = [(0, i) for i in range(workers)]
+    for info in sorted(infos, key=lambda x: x.compress_size, reverse=True):
+        load, i = heapq.heappop(heap)
+        shards[i].append(info.filename)
+        # 每个文件额外计入固定开销，避免大量小文件全部分到同一个线程
+        heapq.heappush(heap, (load + info.compress_size + 4096, i))
+    return [shard for shard in shards if shard]
+
+
+def _member_dir(name, target_dir):
+    # 与 ZipFile.extract 相同的规则去掉盘符、绝对路径和 ..，得到成员解压后所在的目录
+    parts = os.path.splitdrive(name.replace('/', os.sep))[1].split(os.sep)
+    parts = [part for part in parts[:-1] if part not in ('', os.curdir, os.pardir)]
+    return os.path.join(target_dir, *parts)
+
+
+def _extract_shard(zip_file_path, names, target_dir):
+    # 每个线程使用独立的 ZipFile 句柄，zlib 解压时会释放 GIL
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for name in names:
+            zip_ref.extract(name, target_dir)
+
+
+def parallel_extractall(zip_file_path, target_dir, workers=None):
+    """
+    多线程解压整个 ZIP 文件
+
+    :param zip_file_path: ZIP 文件路径
+    :param target_dir: 解压目录
+    :param workers: 线程数，默认为 CPU 核数
+    """
+    workers = workers or os.cpu_count() or 1
+    files = []
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                zip_ref.extract(info, target_dir)
+            else:
+                files.append(info)
+    # 先创建所有成员的父目录，.pptx 等压缩包没有目录条目，
+    # ZipFile.extract 内部的 os.makedirs 不带 exist_ok，多个线程同时创建同一目录会报 FileExistsError
+    for info in files:
+        os.makedirs(_member_dir(info.filename, target_dir), exist_ok=True)
+    shards = shard_members(files, min(workers, max(len(files), 1)))
+    with ThreadPoolExecutor(max_workers=len(shards) or 1) as executor:
+        futures = [
+            executor.submit(_extract_shard, zip_file_path, shard, target_dir)
+            for shard in shards
+        ]
+        for future in futures:
+            future.result()
+
 
 @contextmanager
-def unzip_to_temp(zip_file_path):
+def unzip_to_temp(zip_file_path, workers=1, use_ram=False, temp_root=None):
     """
     解压缩 ZIP 文件到临时目录，并在使用后删除临时目录。
 
     :param zip_file_path: ZIP 文件路径
+    :param workers: 解压线程数，1 表示单线程 extractall，None 表示使用 CPU 核数
+    :param use_ram: 是否解压到内存文件系统（/dev/shm），不存在时使用默认临时目录
+    :param temp_root: 临时目录所在的父目录，优先于 use_ram
     """
-    temp_dir = tempfile.mkdtemp()  # 创建一个临时目录
+    if temp_root is None and use_ram and os.path.isdir(RAM_DIR):
+        temp_root = RAM_DIR
+    temp_dir = tempfile.mkdtemp(dir=temp_root)  # 创建一个临时目录
     
     try:
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)  # 解压到临时目录
+        if workers == 1:
+            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+                zip_ref.extractall(temp_dir)  # 解压到临时目录
+        else:
+            parallel_extractall(zip_file_path, temp_dir, workers=workers)
         
         yield temp_dir  # 返回临时目录路径
     finally:
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)  # 删除临时目录及其内容
 
+
+class LazyZip:
+    """
+    按需访问 ZIP 文件中的成员，只有真正读取的成员才会被解压。
+
+    - members(): 按 glob 模式过滤后的成员名
+    - open(name) / read(name): 直接从压缩包中只读访问，不落盘
+    - extract(name): 第一次访问时才把单个成员解压到临时目录，返回文件路径
+    """
+
+    def __init__(self, zip_file_path, patterns=None):
+        """
+        :param zip_file_path: ZIP 文件路径
+        :param patterns: 成员名的 glob 模式列表，如 ['ppt/notesSlides/*.xml']，为空时不过滤
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = patterns
+        self._zip = zipfile.ZipFile(zip_file_path, 'r')
+        self._temp_dir = None  # 第一次解压时才创建
+        self._extracted = {}
+
+    def match(self, name):
+        """
+        成员名是否符合 glob 模式
+        """
+        if not self.patterns:
+            return True
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)
+
+    def members(self):
+        """
+        返回符合 glob 模式的成员名列表（不包含目录）
+        """
+        return [
+            info.filename
+            for info in self._zip.infolist()
+            if not info.is_dir() and self.match(info.filename)
+        ]
+
+    def _check(self, name):
+        if not self.match(name):
+            raise KeyError(f"{name} 不符合过滤条件 {self.patterns}")
+
+    def open(self, name):
+        """
+        以只读文件对象打开成员，数据直接从压缩包中解压读取
+        """
+        self._check(name)
+        return self._zip.open(name, 'r')
+
+    def read(self, name):
+        """
+        读取成员的全部内容
+        """
+        self._check(name)
+        return self._zip.read(name)
+
+    @property
+    def temp_dir(self):
+        """
+        临时目录，第一次访问时创建
+        """
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp()
+        return self._temp_dir
+
+    def extract(self, name):
+        """
+        把单个成员解压到临时目录，重复调用时直接返回已解压的路径
+        """
+        self._check(name)
+        if name not in self._extracted:
+            self._extracted[name] = self._zip.extract(name, self.temp_dir)
+        return self._extracted[name]
+
+    def close(self):
+        """
+        关闭压缩包并删除临时目录
+        """
+        self._zip.close()
+        if self._temp_dir is not None and os.path.exists(self._temp_dir):
+            shutil.rmtree(self._temp_dir)
+        self._temp_dir = None
+        self._extracted.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@contextmanager
+def lazy_unzip(zip_file_path, patterns=None):
+    """
+    按需访问 ZIP 文件，只解压或读取实际用到的成员，并在使用后删除临时目录。
+
+    :param zip_file_path: ZIP 文件路径
+    :param patterns: 成员名的 glob 模式列表，为空时不过滤
+    """
+    lazy_zip = LazyZip(zip_file_path, patterns)
+    try:
+        yield lazy_zip
+    finally:
+        lazy_zip.close()
+
 # 使用上下文管理器
 if __name__ == "__main__":
     zip_file_path = 'example.zip'  # 替换为你的 ZIP 文件路径
@@ -3,66 +3,635 @@
 # Created on: 2025-01-17 10:43:39
 # Description: This script is used to convert multiple images to a gif file.
 """
-! pip install pillow imageio
+! pip install pillow imageio numpy
 """
 
+import io
+import os
+import re
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Iterable, Sequence
+
+import numpy as np
 from PIL import Image
 
+LUT_BITS = 5  # 颜色查找表每个通道的位数，32x32x32
+TRANSPARENT_INDEX = 255  # 帧间差分时预留的透明色索引
+MAX_DELAY = 0xFFFF  # GIF 单帧显示时间的上限（百分之一秒），超出部分用透明的 1x1 帧补足
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tif", ".tiff")
+# 4x4 Bayer 矩阵，用于有序抖动
+BAYER_4X4 = np.array(
+    [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]], dtype=np.float32
+) / 16 - 0.5
 
-def convert_to_gif(
-    image_files: list[str], output_file_name: str, duration: int = 500, loop: int = 0
+
+def _read_sub_blocks(data: bytes, pos: int) -> int:
+    """
+    跳过 GIF 的数据子块，返回结束符之后的位置
+    """
+    while data[pos] != 0:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+def encode_frame(frame: Image.Image) -> tuple[bytes, bytes]:
+    """
+    用 Pillow 把单帧编码为 GIF，再从中取出调色板和 LZW 图像数据
+    - param frame: P 模式的图片
+    - return: (调色板, LZW 图像数据), 调色板长度为 3*2^n 字节
+    """
+    buffer = io.BytesIO()
+    frame.save(buffer, format="GIF", optimize=False, interlace=False)
+    data = buffer.getvalue()
+
+    packed = data[10]
+    pos = 13
+    palette = b""
+    if packed & 0x80:
+        size = 3 << ((packed & 0x07) + 1)
+        palette = data[pos : pos + size]
+        pos += size
+
+    while data[pos] != 0x2C:  # 跳过扩展块
+        if data[pos] != 0x21:
+            raise ValueError("无法解析 Pillow 生成的 GIF 数据")
+        pos = _read_sub_blocks(data, pos + 2)
+
+    packed = data[pos + 9]
+    pos += 10
+    if packed & 0x80:  # 单帧图片一般只有全局调色板
+        size = 3 << ((packed & 0x07) + 1)
+        palette = data[pos : pos + size]
+        pos += size
+
+    end = _read_sub_blocks(data, pos + 1)
+    return palette, data[pos:end]
+
+
+def color_table_bits(palette: bytes) -> int:
+    """
+    GIF 调色板大小字段，调色板大小为 2^(bits+1) 个颜色
+    """
+    colors = max(len(palette) // 3, 2)
+    return (colors - 1).bit_length() - 1
+
+
+def to_palette_image(image: Image.Image) -> Image.Image:
+    """
+    转换为 GIF 可以直接编码的 P 模式图片
+    """
+    if image.mode == "P" and "transparency" not in image.info:
+        return image
+    if "transparency" in image.info:
+        image = image.convert("RGBA")
+    return image.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+
+
+def build_global_palette(
+    frames: Sequence, colors: int = 256, sample: int = 16, sample_size: int = 256
+) -> np.ndarray:
+    """
+    从部分帧中生成所有帧共用的调色板
+    - param frames: 图片路径或 Image 对象的序列（需要按下标采样，不接受生成器）
+    - param colors: 颜色数量, int, default=256
+    - param sample: 采样帧数，均匀地从所有帧中抽取, int, default=16
+    - param sample_size: 采样帧缩小后的最大边长, int, default=256
+    - return: 调色板, np.ndarray, shape=(colors, 3), dtype=uint8
+    """
+    if not isinstance(frames, Sequence):
+        raise TypeError("采样需要图片序列，生成器请先转为列表")
+    step = max(len(frames) // sample, 1)
+    thumbs = []
+    for image in iter_frames(frames[::step][:sample]):
+        thumb = image.convert("RGB")
+        thumb.thumbnail((sample_size, sample_size))
+        thumbs.append(np.asarray(thumb).reshape(-1, 3))
+    if not thumbs:
+        raise ValueError("没有可以采样的图片")
+
+    pixels = np.concatenate(thumbs)
+    strip = Image.fromarray(pixels.reshape(1, -1, 3))
+    quantized = strip.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    palette = np.array(quantized.getpalette()[: colors * 3], dtype=np.uint8).reshape(-1, 3)
+    if len(palette) < colors:  # 颜色不足时用黑色补齐
+        palette = np.vstack([palette, np.zeros((colors - len(palette), 3), dtype=np.uint8)])
+    return palette
+
+
+class PaletteMapper:
+    """
+    把 RGB 图片映射到固定调色板上
+
+    预先计算 RGB 查找表（每个通道 LUT_BITS 位），每帧只需要一次向量化的查表
+    """
+
+    def __init__(self, palette: np.ndarray):
+        """
+        - param palette: 调色板, np.ndarray, shape=(n, 3)
+        """
+        self.palette = np.asarray(palette, dtype=np.uint8)
+        self.lut = self._build_lut(self.palette)
+        colors = 1 << (color_table_bits(self.palette.tobytes()) + 1)
+        padded = np.zeros((colors, 3), dtype=np.uint8)
+        padded[: len(self.palette)] = self.palette
+        self.palette_bytes = padded.tobytes()
+
+    @staticmethod
+    def _build_lut(palette: np.ndarray) -> np.ndarray:
+        size = 1 << LUT_BITS
+        step = 256 // size
+        levels = np.arange(size, dtype=np.int32) * step + step // 2  # 每个格子的中心
+        grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+        pal = palette.astype(np.float32)
+        # |g-p|^2 = |g|^2 - 2g·p + |p|^2，|g|^2 对 argmin 没有影响
+        dist = (pal * pal).sum(axis=1)[None, :] - 2 * grid.astype(np.float32) @ pal.T
+        return np.argmin(dist, axis=1).astype(np.uint8).reshape(size, size, size)
+
+    def map_array(self, rgb: np.ndarray, dither: bool = False) -> np.ndarray:
+        """
+        把 RGB 数组映射为调色板索引
+        - param rgb: np.ndarray, shape=(h, w, 3), dtype=uint8
+        - param dither: 是否使用有序抖动, bool
+        - return: 调色板索引, np.ndarray, shape=(h, w), dtype=uint8
+        """
+        shift = 8 - LUT_BITS
+        if dither:
+            h, w = rgb.shape[:2]
+            threshold = np.tile(BAYER_4X4, (h // 4 + 1, w // 4 + 1))[:h, :w, None]
+            rgb = np.clip(rgb + threshold * (1 << shift), 0, 255).astype(np.uint8)
+        return self.lut[rgb[..., 0] >> shift, rgb[..., 1] >> shift, rgb[..., 2] >> shift]
+
+    def map(self, image: Image.Image, dither: bool = False) -> Image.Image:
+        """
+        把图片映射到调色板
+        - param image: 图片
+        - param dither: 是否使用有序抖动, bool
+        - return: 使用该调色板的 P 模式图片
+        """
+        frame = Image.fromarray(self.map_array(to_rgb_array(image), dither), mode="P")
+        frame.putpalette(self.palette_bytes)
+        return frame
+
+
+def to_rgb_array(image: Image.Image) -> np.ndarray:
+    """
+    转换为 RGB 数组
+    """
+    if "transparency" in image.info:
+        image = image.convert("RGBA")
+    return np.asarray(image.convert("RGB"))
+
+
+def _quantize_reserved(
+    rgb: np.ndarray, mapper: PaletteMapper = None, dither: bool = False
+) -> tuple[np.ndarray, bytes]:
+    """
+    量化为最多 255 色，保留 TRANSPARENT_INDEX 作为透明色
+    - return: (调色板索引, 256 色调色板)
+    """
+    if mapper is not None:
+        indices = mapper.map_array(rgb, dither)
+        palette = mapper.palette_bytes
+    else:
+        quantized = Image.fromarray(rgb).quantize(colors=TRANSPARENT_INDEX)
+        indices = np.asarray(quantized)
+        palette = bytes(quantized.getpalette()[: TRANSPARENT_INDEX * 3]).ljust(256 * 3, b"\x00")
+    return indices, palette
+
+
+def optimize_frames(
+    images: Iterable[Image.Image], duration: int, mapper: PaletteMapper = None, dither: bool = False
 ):
     """
-    转换图片到 GIF 文件
-    - param image_files: 图片文件列表, list[str]
+    帧间差分优化: 与上一帧完全相同的帧合并（时间相加），其余帧只保留变化区域，
+    区域内未变化的像素设为透明。只保留上一帧和待写入的一帧，内存占用与帧数无关
+    - param images: 图片的可迭代对象
+    - param duration: 每帧的显示时间（毫秒）, int
+    - param mapper: 全局调色板映射器，调色板中 TRANSPARENT_INDEX 必须空闲；为空时每帧单独量化
+    - param dither: 使用全局调色板时是否抖动, bool
+    - return: 逐个返回 (P 模式图片, 显示时间, 偏移, 透明色索引)
+    """
+    prev = None
+    pending = None
+    for image in images:
+        rgb = to_rgb_array(image)
+        if prev is not None and rgb.shape != prev.shape:
+            # 尺寸不同的帧缩放到画布大小
+            rgb = np.asarray(Image.fromarray(rgb).resize((prev.shape[1], prev.shape[0])))
+
+        if prev is None:
+            top, bottom, left, right = 0, rgb.shape[0], 0, rgb.shape[1]
+        else:
+            changed = (rgb != prev).any(axis=-1)
+            if not changed.any():
+                pending[1] += duration
+                continue
+            rows = np.flatnonzero(changed.any(axis=1))
+            cols = np.flatnonzero(changed.any(axis=0))
+            top, bottom = rows[0], rows[-1] + 1
+            left, right = cols[0], cols[-1] + 1
+
+        indices, palette = _quantize_reserved(rgb[top:bottom, left:right], mapper, dither)
+        transparency = None
+        if prev is not None:
+            unchanged = ~changed[top:bottom, left:right]
+            if unchanged.any():
+                indices = indices.copy()
+                indices[unchanged] = TRANSPARENT_INDEX
+                transparency = TRANSPARENT_INDEX
+        frame = Image.fromarray(indices, mode="P")
+        frame.putpalette(palette)
+
+        if pending is not None:
+            yield tuple(pending)
+        pending = [frame, duration, (int(left), int(top)), transparency]
+        prev = rgb
+
+    if pending is not None:
+        yield tuple(pending)
+
+
+class GifStreamWriter:
+    """
+    逐帧写入 GIF 文件，不在内存中保留已写入的帧
+    """
+
+    def __init__(
+        self,
+        output_file_name: str,
+        loop: int = 0,
+        size: tuple[int, int] = None,
+        global_palette: bytes = None,
+    ):
+        """
+        - param output_file_name: 输出 GIF 文件名, str
+        - param loop: 循环次数（0 表示无限循环，None 表示不循环）, int
+        - param size: 画布大小，为空时使用第一帧的大小, tuple[int, int]
+        - param global_palette: 全局调色板，长度为 3*2^n 字节；设置后写入的帧必须已经映射到该调色板, bytes
+        """
+        self.output_file_name = output_file_name
+        self.loop = loop
+        self.size = size
+        self.global_palette = global_palette
+        self.frame_count = 0
+        self._fp = open(output_file_name, "wb")
+
+    def _write_header(self):
+        width, height = self.size
+        if self.global_palette is None:
+            # 不使用全局调色板，每帧使用自己的局部调色板
+            self._fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        else:
+            flags = 0x80 | 0x70 | color_table_bits(self.global_palette)
+            self._fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, flags, 0, 0))
+            self._fp.write(self.global_palette)
+        if self.loop is not None:
+            self._fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+
+    def write(
+        self,
+        frame: Image.Image,
+        duration: int,
+        offset: tuple[int, int] = (0, 0),
+        transparency: int = None,
+        disposal: int = 0,
+    ):
+        """
+        写入一帧
+        - param frame: 图片，非 P 模式会先转换
+        - param duration: 显示时间（毫秒）, int
+        - param offset: 帧在画布上的位置, tuple[int, int]
+        - param transparency: 透明色索引, int
+        - param disposal: 处理方式（0 不指定，1 保留，2 恢复背景）, int
+        """
+        frame = to_palette_image(frame)
+        if self.size is None:
+            self.size = frame.size
+        if self.frame_count == 0:
+            self._write_header()
+
+        delay = round(duration / 10)
+        if delay <= MAX_DELAY:
+            self._write_image(frame, delay, offset, transparency, disposal)
+        else:
+            # 合并后的显示时间超出 16 位字段时，先保留该帧，再追加透明的 1x1 帧延长显示时间
+            self._write_image(frame, MAX_DELAY, offset, transparency, 1)
+            delay -= MAX_DELAY
+            filler = Image.new("P", (1, 1), 0)
+            filler.putpalette(b"\x00" * 6)
+            while delay > 0:
+                self._write_image(filler, min(delay, MAX_DELAY), (0, 0), 0, 1)
+                delay -= MAX_DELAY
+        self.frame_count += 1
+
+    def _write_image(
+        self, frame: Image.Image, delay: int, offset: tuple[int, int], transparency: int, disposal: int
+    ):
+        palette, lzw_data = encode_frame(frame)
+        if self.global_palette is None:
+            local_table = bytes([0x80 | color_table_bits(palette)]) + palette
+        else:
+            local_table = b"\x00"
+        packed = (disposal << 2) | (1 if transparency is not None else 0)
+        self._fp.write(
+            b"!\xf9\x04"
+            + struct.pack("<BHB", packed, delay, transparency or 0)
+            + b"\x00"
+        )
+        self._fp.write(
+            b","
+            + struct.pack("<HHHH", offset[0], offset[1], frame.width, frame.height)
+            + local_table
+            + lzw_data
+        )
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self._fp.write(b";")
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_frames(frames: Iterable):
+    """
+    逐个打开图片，使用后立即关闭；传入的 Image 对象由调用方管理，不会被关闭
+    - param frames: 图片路径或 Image 对象的可迭代对象
+    """
+    for frame in frames:
+        if not isinstance(frame, str):
+            yield frame
+            continue
+        image = Image.open(frame)
+        try:
+            yield image
+        finally:
+            image.close()
+
+
+def stream_to_gif(
+    frames: Iterable,
+    output_file_name: str,
+    duration: int = 500,
+    loop: int = 0,
+    global_palette: bool = False,
+    dither: bool = False,
+    sample: int = 16,
+    optimize: bool = False,
+    palette_frames: Sequence = None,
+):
+    """
+    流式转换图片到 GIF 文件，每次只解码一帧，写入后立即关闭，内存占用与帧数无关
+    - param frames: 图片路径或 Image 对象的可迭代对象，可以是生成器
     - param output_file_name: 输出 GIF 文件名, str
     - param duration: 每帧的显示时间（毫秒）, int, default=500
     - param loop: 循环次数（0 表示无限循环）, int, default=0
+    - param global_palette: 是否所有帧共用一个调色板（需要先采样，生成器会被转成列表）, bool, default=False
+    - param dither: 使用全局调色板时是否抖动, bool, default=False
+    - param sample: 生成全局调色板时的采样帧数, int, default=16
+    - param optimize: 是否进行帧间差分优化（裁剪变化区域、合并相同帧），见 optimize_frames, bool, default=False
+    - param palette_frames: 用于生成全局调色板的帧序列（如图片路径列表，不能是生成器），为空时使用 frames, Sequence
     - return: 输出 GIF 文件名, str
     """
     if not output_file_name.lower().endswith(".gif"):
         output_file_name += ".gif"
 
-    # 打开所有图片并存入列表
-    images = [Image.open(image) for image in image_files]
+    mapper = None
+    if global_palette:
+        if palette_frames is None:
+            frames = palette_frames = list(frames)
+        # 差分优化时预留一个颜色作为透明色
+        colors = TRANSPARENT_INDEX if optimize else 256
+        mapper = PaletteMapper(build_global_palette(palette_frames, colors=colors, sample=sample))
 
-    # 保存为 GIF
-    images[0].save(
-        output_file_name,  # 输出文件名
-        save_all=True,  # 保存所有图片
-        append_images=images[1:],  # 添加剩余图片
-        duration=duration,  # 每帧的显示时间（毫秒）
-        loop=loop,  # 循环次数（0 表示无限循环）
-    )
+    with GifStreamWriter(
+        output_file_name,
+        loop=loop,
+        global_palette=mapper.palette_bytes if mapper is not None else None,
+    ) as writer:
+        if optimize:
+            for frame, frame_duration, offset, transparency in optimize_frames(
+                iter_frames(frames), duration, mapper=mapper, dither=dither
+            ):
+                writer.write(frame, frame_duration, offset, transparency, disposal=1)
+        else:
+            for image in iter_frames(frames):
+                if mapper is not None:
+                    image = mapper.map(image, dither=dither)
+                writer.write(image, duration)
+    if writer.frame_count == 0:
+        raise ValueError("没有可以写入的图片")
     print(f"Gif file saved to {output_file_name}")
     return output_file_name
 
 
+def convert_to_gif(
+    image_files: list[str],
+    output_file_name: str,
+    duration: int = 500,
+    loop: int = 0,
+    global_palette: bool = False,
+    dither: bool = False,
+    optimize: bool = False,
+):
+    """
+    转换图片到 GIF 文件，每次只解码一帧（见 stream_to_gif）
+    - param image_files: 图片文件列表, list[str]
+    - param output_file_name: 输出 GIF 文件名, str
+    - param duration: 每帧的显示时间（毫秒）, int, default=500
+    - param loop: 循环次数（0 表示无限循环）, int, default=0
+    - param global_palette: 是否所有帧共用一个调色板，见 stream_to_gif, bool, default=False
+    - param dither: 使用全局调色板时是否抖动, bool, default=False
+    - param optimize: 是否进行帧间差分优化，见 optimize_frames, bool, default=False
+    - return: 输出 GIF 文件名, str
+    """
+    # 逐帧流式写入，内存占用与帧数无关
+    return stream_to_gif(
+        image_files,
+        output_file_name,
+        duration,
+        loop,
+        global_palette=global_palette,
+        dither=dither,
+        optimize=optimize,
+    )
+
+
+# region 批量转换
+def natural_key(path: str):
+    """
+    自然排序的键，如 2.png 排在 10.png 之前，与路径分隔符无关
+    """
+    name = os.path.basename(path).lower()
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def list_images(image_dir: str) -> list[str]:
+    """
+    列出目录下的图片文件，按自然顺序排列
+    """
+    files = [
+        os.path.join(image_dir, file)
+        for file in os.listdir(image_dir)
+        if file.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    return sorted(files, key=natural_key)
+
+
+def load_frame(image_file: str, max_size: int = None) -> Image.Image:
+    """
+    解码一帧，可选缩放到最大边长 max_size
+    """
+    with Image.open(image_file) as image:
+        image.load()
+        if max_size is None:
+            return image.copy()
+        if "transparency" in image.info:
+            image = image.convert("RGBA")
+        else:
+            image = image.copy()
+        image.thumbnail((max_size, max_size))
+        return image
+
+
+def prefetch_frames(image_files: list[str], max_size: int = None, workers: int = 4):
+    """
+    使用线程池提前解码和缩放后面的帧，按原顺序返回。最多同时保留 workers*2 帧
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        files = iter(image_files)
+        for image_file in files:
+            pending.append(executor.submit(load_frame, image_file, max_size))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            image = pending.popleft().result()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append(executor.submit(load_frame, next_file, max_size))
+            yield image
+
+
+def folder_to_gif(
+    image_dir: str,
+    output_file_name: str,
+    duration: int = 500,
+    loop: int = 0,
+    max_size: int = None,
+    decode_workers: int = 4,
+    global_palette: bool = False,
+    dither: bool = False,
+    optimize: bool = False,
+):
+    """
+    把一个目录下的图片按自然顺序转换为 GIF
+    - param image_dir: 图片目录, str
+    - param output_file_name: 输出 GIF 文件名, str
+    - param max_size: 缩放后的最大边长，为空时不缩放, int
+    - param decode_workers: 解码线程数, int, default=4
+    - 其余参数见 stream_to_gif
+    - return: 输出 GIF 文件名, str
+    """
+    image_files = list_images(image_dir)
+    if not image_files:
+        raise ValueError(f"{image_dir} 中没有图片")
+    return stream_to_gif(
+        prefetch_frames(image_files, max_size=max_size, workers=decode_workers),
+        output_file_name,
+        duration=duration,
+        loop=loop,
+        global_palette=global_palette,
+        dither=dither,
+        optimize=optimize,
+        palette_frames=image_files,
+    )
+
+
+def batch_to_gif(root_dir: str, output_dir: str = None, workers: int = None, **kwargs) -> dict:
+    """
+    把根目录下的每个子目录转换为一个同名 GIF，多个目录在进程池中并行编码
+    - param root_dir: 根目录, str
+    - param output_dir: 输出目录，为空时输出到根目录, str
+    - param workers: 进程数，默认为 CPU 核数, int
+    - param kwargs: 传给 folder_to_gif 的参数
+    - return: {子目录名: 输出文件名或异常}
+    """
+    output_dir = output_dir or root_dir
+    os.makedirs(output_dir, exist_ok=True)
+    image_dirs = sorted(
+        (name for name in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, name))),
+        key=natural_key,
+    )
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                folder_to_gif,
+                os.path.join(root_dir, name),
+                os.path.join(output_dir, f"{name}.gif"),
+                **kwargs,
+            ): name
+            for name in image_dirs
+            if list_images(os.path.join(root_dir, name))
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把目录下每个子目录中的图片转换为 GIF")
+    parser.add_argument("root_dir", help="根目录，每个子目录生成一个 GIF")
+    parser.add_argument("-o", "--output-dir", default=None, help="输出目录，默认为根目录")
+    parser.add_argument("-d", "--duration", type=int, default=500, help="每帧的显示时间（毫秒）")
+    parser.add_argument("--loop", type=int, default=0, help="循环次数（0 表示无限循环）")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行编码的进程数")
+    parser.add_argument("--decode-workers", type=int, default=4, help="每个目录的解码线程数")
+    parser.add_argument("--max-size", type=int, default=None, help="缩放后的最大边长")
+    parser.add_argument("--global-palette", action="store_true", help="所有帧共用一个调色板")
+    parser.add_argument("--dither", action="store_true", help="使用全局调色板时抖动")
+    parser.add_argument("--optimize", action="store_true", help="帧间差分优化")
+    args = parser.parse_args(argv)
+
+    results = batch_to_gif(
+        args.root_dir,
+        args.output_dir,
+        workers=args.workers,
+        duration=args.duration,
+        loop=args.loop,
+        max_size=args.max_size,
+        decode_workers=args.decode_workers,
+        global_palette=args.global_palette,
+        dither=args.dither,
+        optimize=args.optimize,
+    )
+    failed = 0
+    for name, result in sorted(results.items()):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"转换失败: {name}: {result}")
+    print(f"共{len(results)}个目录, 成功{len(results) - failed}个, 失败{failed}个")
+    return 1 if failed else 0
+
+
+# endregion
+
+
 if __name__ == "__main__":
-    import os
-
-    # test_base_dir = "image/多图转gif"
-    # image_dirs = os.listdir(test_base_dir)
-    # print(image_dirs)
-
-    # for i, image_dir in enumerate(image_dirs):
-    #     image_files = [
-    #         os.path.join(test_base_dir, image_dir, file)
-    #         for file in os.listdir(os.path.join(test_base_dir, image_dir))
-    #     ]
-    #     output_file_name = os.path.join(test_base_dir, f"{image_dir}.gif")
-    #     output_file_name = convert_to_gif(image_files, output_file_name, duration=1000)
-    #     print("转换完成:", i + 1, output_file_name)
-
-    image_dir1 = r'image\多图转gif\origin'
-    image_dir2 = r'image\多图转gif\new'
-    
-    image_files1 = [os.path.join(image_dir1, file) for file in os.listdir(image_dir1)]
-    image_files2 = [os.path.join(image_dir2, file) for file in os.listdir(image_dir2)]
-    
-    image_files1 = sorted(image_files1, key=lambda x: int(x.split('\\')[-1].split('.')[0]))
-    image_files2 = sorted(image_files2, key=lambda x: int(x.split('\\')[-1].split('.')[0]))
-    
-    duration = 500
-    convert_to_gif(image_files1, 'origin', duration=duration)
-    convert_to_gif(image_files2, 'new', duration=duration)
\ No newline at end of file
+    # python -m Scripts.多图转gif image/多图转gif -d 500
+    raise SystemExit(main())
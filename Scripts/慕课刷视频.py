@@ -114,15 +114,23 @@ def open_new_video(video_url: str):
     pg.press("enter")  # 回车跳转到下一个视频
 
 
-def main():
-    start = 27643737
-    end = 27643801
-    student_id = None  # 学生ID，可在地址栏中找到
+def main(argv: list[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="自动播放雨课堂视频")
+    parser.add_argument("--start", type=int, default=27643737, help="开始的视频序号")
+    parser.add_argument("--end", type=int, default=27643801, help="结束的视频序号")
+    parser.add_argument("--student-id", default=None, help="学生ID，可在地址栏中找到")
+    args = parser.parse_args(argv)
+
+    start = args.start
+    end = args.end
+    student_id = args.student_id  # 学生ID，可在地址栏中找到
     url_template = r"https://changjiang.yuketang.cn/v2/web/xcloud/video-student/{student_id}/{video_id}?hide_return=1"
 
     for video_id in range(start, end + 1):
         start_time = time.time()
-        url = url_template.format(video_id=video_id)  # 生成视频URL
+        url = url_template.format(student_id=student_id, video_id=video_id)  # 生成视频URL
         open_new_video(url)
         time.sleep(2)
         play_video()
@@ -143,7 +151,8 @@ def main():
             time.sleep(2)  # 等待
 
     print("ok")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -51,15 +51,28 @@ class DraggableFrame(tk.Frame):
         pg.moveTo(CLICK_POSITION)
         pg.click()
 
-# 创建主窗口
-root = tk.Tk()
-root.resizable(False, False)
-root.attributes('-topmost', True)
-root.overrideredirect(True)
-root.geometry('40x30+470+400')
+def main(argv: list[str] = None):
+    global CLICK_POSITION
+    import argparse
+    parser = argparse.ArgumentParser(description='一个可移动的按钮，点击按钮可以点击其他位置')
+    parser.add_argument('--position', type=int, nargs=2, default=CLICK_POSITION, metavar=('X', 'Y'), help='点击位置')
+    args = parser.parse_args(argv)
+    CLICK_POSITION = tuple(args.position)
 
-# 创建可拖动的框架
-draggable_frame = DraggableFrame(root)
+    # 创建主窗口
+    root = tk.Tk()
+    root.resizable(False, False)
+    root.attributes('-topmost', True)
+    root.overrideredirect(True)
+    root.geometry('40x30+470+400')
 
-root.mainloop()
+    # 创建可拖动的框架
+    draggable_frame = DraggableFrame(root)
+
+    root.mainloop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
 
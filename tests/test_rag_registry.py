@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Description: StoreRegistry 淘汰数据库时要释放chromadb的System，打开的数量不超过max_open
+
+import importlib
+
+import pytest
+
+pytest.importorskip('langchain_chroma')
+from langchain_chroma import Chroma
+from langchain_core.embeddings import FakeEmbeddings
+
+rag = importlib.import_module('Scripts.rag增强检索')
+
+
+def _systems(registry):
+    client = next(iter(registry._pool.values()))._client
+    return rag._system_cache(client)
+
+
+def test_evicted_stores_are_released(tmp_path):
+    embeddings = FakeEmbeddings(size=8)
+    names = [f'db_{i}' for i in range(5)]
+    for name in names:
+        db = Chroma(persist_directory=str(tmp_path / name), embedding_function=embeddings)
+        db.add_texts([name])
+        rag.close_chroma_db(db)
+
+    registry = rag.StoreRegistry(base_dir=str(tmp_path), max_open=2)
+    registry._embeddings = embeddings
+    for name in names:
+        db = registry.get(name)
+        assert db.similarity_search(name, k=1)[0].page_content == name
+
+    assert registry.open_stores() == names[-2:]
+    assert len(_systems(registry)) == 2
+
+    systems = _systems(registry)
+    registry.clear()
+    assert registry.open_stores() == []
+    assert len(systems) == 0
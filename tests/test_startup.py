@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Description: python -m Scripts 的轻量子命令不能导入重量级依赖，防止它们又被放到模块顶层导入
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+from Scripts.__main__ import STARTUP_COMMANDS
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 只在真正执行识别、分离、检索时才需要的包
+HEAVY_MODULES = {
+    'torch', 'paddle', 'paddleocr', 'cv2', 'demucs', 'gradio', 'pyautogui',
+    'langchain', 'langchain_core', 'langchain_chroma', 'langchain_openai', 'langchain_community',
+    'chromadb', 'openai', 'pandas',
+}
+MARKER = '--- imported modules ---'
+# 在子进程中执行命令，然后在MARKER之后输出已导入的模块
+PROBE = f'''
+import sys
+from Scripts.__main__ import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print({MARKER!r})
+print('\\n'.join(sys.modules))
+'''
+COMMANDS = [[*command, '--help'] for command in STARTUP_COMMANDS] + [['rag', '--help'], ['rag', 'list']]
+
+
+@pytest.mark.parametrize('command', COMMANDS, ids=' '.join)
+def test_no_heavy_imports(command, tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    # 在空目录中执行，rag list 不会读到仓库里的向量库
+    result = subprocess.run([sys.executable, '-c', PROBE, *command], cwd=tmp_path, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    modules = result.stdout.split(MARKER)[-1].split()
+    imported = {name.split('.')[0] for name in modules}
+    assert not imported & HEAVY_MODULES, f"python -m Scripts {' '.join(command)} 导入了 {sorted(imported & HEAVY_MODULES)}"